@@ -0,0 +1,230 @@
+"""
+Asyncio facade of the Merkle Tree application.
+
+The merkle tree calls are CPU bound: ``AsyncMerkleTree`` runs them in a
+thread pool so they do not block the event loop, computes the proofs
+requested concurrently for the same leaf once, and checks the proofs
+requested in the same loop iteration with a single ``verify_batch``.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import asyncio
+from functools import partial
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from src.apps.merkle import MerkleTree, verify_batch
+
+# A proof of ``get_merkle_proof`` or of ``encode_proof``
+_Proof = Union[Sequence[str], bytes, memoryview]
+
+# A pending verify: (leaf, proof, root_tree, future of the result)
+_Pending = Tuple[str, _Proof, str, "asyncio.Future[bool]"]
+
+
+class AsyncMerkleTree:
+    """
+    Serve the proofs of a merkle tree from an asyncio event loop.
+
+    ``build_merkle_tree`` builds a new tree in the executor and replaces the
+    current one once built, so the requests in between are served by the
+    previous tree.
+
+    The executor runs the methods of the tree served, so it must share the
+    memory of the event loop: a thread pool. A process pool would build a
+    copy of the tree in a child process, and pickle the whole tree for
+    every proof.
+    """
+
+    def __init__(
+        self,
+        tree: Optional[MerkleTree] = None,
+        executor: Optional[Executor] = None,
+        max_batch_size: int = 4096,
+    ):
+        """
+        Args:
+            tree (MerkleTree): The tree to serve, an empty one by default.
+            executor (Executor): The thread pool running the calls, the
+                default executor of the loop if None.
+            max_batch_size (int): The maximum number of proofs checked by a
+                single ``verify_batch``.
+
+        Raises:
+            ValueError: The executor is a process pool.
+        """
+        if isinstance(executor, ProcessPoolExecutor):
+            raise ValueError("The executor must be a thread pool!")
+        self._tree = tree if tree is not None else MerkleTree()
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self._proofs_in_flight: Dict[str, "asyncio.Future[List[str]]"] = {}
+        self._pending: List[_Pending] = []
+
+    @property
+    def tree(self) -> MerkleTree:
+        """The merkle tree currently served."""
+        return self._tree
+
+    def get_root_tree(self) -> str:
+        """Get the merkle tree root.
+
+        Returns:
+            str: The merkle tree root.
+
+        Raises:
+            IndexError: Merkle tree not created.
+        """
+        return self._tree.get_root_tree()
+
+    async def build_merkle_tree(self, values: List[str]) -> None:
+        """Build a merkle tree in the executor and serve it.
+
+        Args:
+            values (list[str]): The leaves of the merkle tree.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: See ``MerkleTree.build_merkle_tree``.
+        """
+        current = self._tree
+        tree = MerkleTree(
+            binary=current.binary,
+            build_proofs=current.build_proofs,
+            hash_backend=current.hash_backend,
+            proof_cache=current.proof_cache,
+            observer=current.observer,
+            leaf_index=current.leaf_index,
+        )
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, tree.build_merkle_tree, values
+        )
+        self._tree = tree
+        # The proofs in flight are of the previous tree
+        self._proofs_in_flight = {}
+
+    async def get_merkle_proof(self, leaf: str) -> List[str]:
+        """Get the merkle tree proof structure.
+
+        The concurrent requests of the same leaf wait for the same
+        computation.
+
+        Args:
+            leaf (str): The leaf's proof to provide.
+
+        Returns:
+            list[str]: The merkle tree proof structure.
+        """
+        in_flight = self._proofs_in_flight
+        future = in_flight.get(leaf)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, self._tree.get_merkle_proof, leaf
+            )
+            in_flight[leaf] = future
+            future.add_done_callback(lambda _: in_flight.pop(leaf, None))
+        # A cancelled request must not cancel the others
+        return list(await asyncio.shield(future))
+
+    async def verify(self, proof: _Proof, root_tree: str, leaf: str) -> bool:
+        """Check that a value is part of the merkle tree.
+
+        The requests of the same loop iteration are checked together by
+        ``verify_batch`` in the executor.
+
+        Args:
+            proof (list[str] | bytes): The proofs values, or a proof of
+                ``encode_proof``.
+            root_tree (str): The merkle tree root.
+            leaf (str): The value to check.
+
+        Returns:
+            True if the value is part of the merkle tree.
+        """
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[bool]" = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.append((leaf, proof, root_tree, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        return await future
+
+    async def verify_batch(
+        self, items: List[Tuple[str, _Proof]], root_tree: str
+    ) -> List[bool]:
+        """Check that many values are part of the merkle tree.
+
+        Args:
+            items (list): The (leaf, proof) pairs to check.
+            root_tree (str): The merkle tree root.
+
+        Returns:
+            list[bool]: True for each value part of the merkle tree.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self._tree.verify_batch, items, root_tree
+        )
+
+    def _flush(self) -> None:
+        """Check the pending verify requests in the executor.
+
+        Returns:
+            None
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        # verify_batch checks against a single root
+        batches: Dict[str, List[_Pending]] = {}
+        for request in pending:
+            batches.setdefault(request[2], []).append(request)
+
+        loop = asyncio.get_running_loop()
+        for root_tree, batch in batches.items():
+            items = [(leaf, proof) for leaf, proof, _, _ in batch]
+            result = loop.run_in_executor(
+                self.executor,
+                verify_batch,
+                items,
+                root_tree,
+                None,
+                len(items),
+                self._tree.hash_backend,
+            )
+            result.add_done_callback(partial(self._resolve, batch=batch))
+
+    @staticmethod
+    def _resolve(
+        result: "asyncio.Future[List[bool]]", batch: List[_Pending]
+    ) -> None:
+        """Set the results of a batch of verify requests.
+
+        Args:
+            result (Future): The result of ``verify_batch``.
+            batch (list): The requests of the batch.
+
+        Returns:
+            None
+        """
+        if result.cancelled():
+            for _, _, _, future in batch:
+                future.cancel()
+            return
+
+        error = result.exception()
+        for i, (_, _, _, future) in enumerate(batch):
+            if future.done():
+                # Cancelled by the caller
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result.result()[i])
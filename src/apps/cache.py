@@ -0,0 +1,137 @@
+"""
+Proof cache of the Merkle Tree application.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+Proof = Tuple[str, ...]
+
+
+class ProofCache:
+    """
+    A bounded LRU cache of merkle tree proofs.
+
+    The proofs are cached with the generation of the tree, which changes on
+    every build and mutation of the tree: a lookup with another generation
+    empties the cache, so a stale proof is never returned. The proofs are
+    tuples, so they cannot be changed by the callers.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, max_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            max_entries (int): The maximum number of proofs cached.
+            max_bytes (int): The maximum total length of the nodes of the
+                proofs cached, no limit if None.
+
+        Raises:
+            ValueError: ``max_entries`` or ``max_bytes`` is not positive.
+        """
+        if max_entries < 1 or (max_bytes is not None and max_bytes < 1):
+            raise ValueError("The cache limits must be positive!")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation: Optional[int] = None
+        self._proofs: "OrderedDict[Hashable, Proof]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._proofs)
+
+    def get(self, key: Hashable, generation: int) -> Optional[Proof]:
+        """Get a cached proof.
+
+        Args:
+            key (Hashable): The leaf or the position of the proof.
+            generation (int): The generation of the tree.
+
+        Returns:
+            tuple: The proof, or None if not cached.
+        """
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+            proof = self._proofs.get(key)
+            if proof is None:
+                self.misses += 1
+                return None
+            self._proofs.move_to_end(key)
+            self.hits += 1
+            return proof
+
+    def put(self, key: Hashable, proof: Proof, generation: int) -> None:
+        """Cache a proof, evicting the least recently used ones if full.
+
+        Args:
+            key (Hashable): The leaf or the position of the proof.
+            proof (tuple): The proof.
+            generation (int): The generation of the tree.
+
+        Returns:
+            None
+        """
+        size = sum(map(len, proof))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+            old = self._proofs.pop(key, None)
+            if old is not None:
+                self._bytes -= sum(map(len, old))
+            self._proofs[key] = proof
+            self._bytes += size
+            while len(self._proofs) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, evicted = self._proofs.popitem(last=False)
+                self._bytes -= sum(map(len, evicted))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all the cached proofs, the counters are kept.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._reset(None)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the counters of the cache.
+
+        Returns:
+            dict: The hits, misses, evictions, entries and bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._proofs),
+                "bytes": self._bytes,
+            }
+
+    def _reset(self, generation: Optional[int]) -> None:
+        """Empty the cache for a new generation of the tree.
+
+        Args:
+            generation (int): The new generation.
+
+        Returns:
+            None
+        """
+        self._proofs.clear()
+        self._bytes = 0
+        self._generation = generation
@@ -0,0 +1,351 @@
+"""
+Hash backends of the Merkle Tree application.
+
+A backend hashes the sorted pairs of nodes of a merkle tree. The nodes are
+32-byte digests, hashed as raw bytes by every backend but ``keccak``, which
+hashes the hex encoding of the pair to stay compatible with the trees built
+before the backends.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from binascii import hexlify
+from typing import Any, Dict, List, Type
+
+from Crypto.Hash import keccak
+
+DIGEST_SIZE = 32
+
+try:
+    # Internals of pycryptodome, to reuse a native keccak state
+    from Crypto.Util import _raw_api
+
+    _RAW_API: Any = _raw_api
+    _KECCAK_LIB: Any = getattr(keccak, "_raw_keccak_lib")
+    _NATIVE_KECCAK = all(
+        hasattr(_KECCAK_LIB, name) for name in (
+            "keccak_init",
+            "keccak_reset",
+            "keccak_absorb",
+            "keccak_digest",
+            "keccak_destroy",
+        )
+    ) and all(
+        hasattr(_RAW_API, name) for name in (
+            "SmartPointer",
+            "VoidPointer",
+            "c_size_t",
+            "c_ubyte",
+            "c_uint8_ptr",
+            "create_string_buffer",
+            "get_raw_buffer",
+        )
+    )
+except (ImportError, AttributeError):
+    _NATIVE_KECCAK = False
+
+
+class _Keccak256:
+    """
+    A keccak-256 hasher reusing a single native state.
+
+    ``keccak.new`` allocates and frees a native state for every hash, this
+    hasher resets the same one. It relies on internals of pycryptodome,
+    see ``_new_keccak``. It is not thread safe: use one per thread.
+    """
+
+    def __init__(self):
+        self._lib = _KECCAK_LIB
+        state = _RAW_API.VoidPointer()
+        result = self._lib.keccak_init(
+            state.address_of(),
+            _RAW_API.c_size_t(2 * DIGEST_SIZE),
+            _RAW_API.c_ubyte(24),
+        )
+        if result:
+            raise ValueError(f"Error {result} while instantiating keccak")
+        self._state = _RAW_API.SmartPointer(
+            state.get(), self._lib.keccak_destroy
+        )
+        self._buffer = _RAW_API.create_string_buffer(DIGEST_SIZE)
+        self._size = _RAW_API.c_size_t(DIGEST_SIZE)
+        self._padding = _RAW_API.c_ubyte(0x01)
+
+    def digest(self, data: bytes) -> bytes:
+        """Hash data.
+
+        Args:
+            data (bytes): The data to hash.
+
+        Returns:
+            bytes: The raw digest.
+        """
+        lib = self._lib
+        state = self._state.get()
+        lib.keccak_reset(state)
+        lib.keccak_absorb(
+            state, _RAW_API.c_uint8_ptr(data), _RAW_API.c_size_t(len(data))
+        )
+        lib.keccak_digest(state, self._buffer, self._size, self._padding)
+        return _RAW_API.get_raw_buffer(self._buffer)
+
+
+class _KeccakNew:
+    """A keccak-256 hasher with a new state for every hash."""
+
+    def digest(self, data: bytes) -> bytes:
+        """Hash data.
+
+        Args:
+            data (bytes): The data to hash.
+
+        Returns:
+            bytes: The raw digest.
+        """
+        return keccak.new(digest_bits=256, data=data).digest()
+
+
+def _new_keccak() -> Any:
+    """Get a new keccak-256 hasher.
+
+    The hasher reuses a native state when the internals of pycryptodome it
+    relies on are found, and falls back to ``keccak.new`` otherwise.
+
+    Returns:
+        The hasher, with a ``digest`` method.
+    """
+    if _NATIVE_KECCAK:
+        return _Keccak256()
+    return _KeccakNew()
+
+
+class HashBackend(ABC):
+    """
+    Base class of the hash backends.
+
+    A backend only has to implement ``digest``. ``hash_pair`` works on raw
+    digests, ``hash_hex_pair`` on their hex encoding, and both give the
+    same node.
+    """
+
+    name = ""
+    # Id of the backend in the encoded proofs, 0 when proofs can't be encoded
+    backend_id = 0
+    # Bytes hashed for a pair of nodes
+    pair_size = 2 * DIGEST_SIZE
+
+    @abstractmethod
+    def digest(self, data: bytes) -> bytes:
+        """Hash data.
+
+        Args:
+            data (bytes): The data to hash.
+
+        Returns:
+            bytes: The raw 32-byte digest.
+        """
+
+    def hash_pair(self, a: bytes, b: bytes) -> bytes:
+        """Sort, concatenate and hash a pair of raw digests.
+
+        Args:
+            a (bytes): The first digest to hash
+            b (bytes): The second digest to hash
+
+        Returns:
+            bytes: The digests concatenated and hashed.
+        """
+        if b < a:
+            a, b = b, a
+        return self.hash_ordered_pair(a, b)
+
+    def hash_ordered_pair(self, a: bytes, b: bytes) -> bytes:
+        """Concatenate and hash a pair of raw digests, in this order.
+
+        Args:
+            a (bytes): The first digest to hash
+            b (bytes): The second digest to hash
+
+        Returns:
+            bytes: The digests concatenated and hashed.
+        """
+        return self.digest(a + b)
+
+    def hash_hex_pair(self, a: str, b: str) -> str:
+        """Sort, concatenate and hash a pair of hex encoded digests.
+
+        Args:
+            a (str): The first digest to hash
+            b (str): The second digest to hash
+
+        Returns:
+            str: The digests concatenated and hashed, hex encoded.
+
+        Raises:
+            ValueError: A value is not hex encoded.
+        """
+        return self.hash_pair(bytes.fromhex(a), bytes.fromhex(b)).hex()
+
+
+class KeccakBackend(HashBackend):
+    """
+    Keccak-256 of the hex encoded pair, the historical hash of the trees.
+
+    Any pair of strings can be hashed, not only digests. The native state
+    is reused, one per thread, and not pickled: an unpickled backend gets
+    new states.
+    """
+
+    name = "keccak"
+    backend_id = 1
+    pair_size = 4 * DIGEST_SIZE
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __reduce__(self):
+        return type(self), ()
+
+    def digest(self, data: bytes) -> bytes:
+        try:
+            hasher = self._local.hasher
+        except AttributeError:
+            hasher = self._local.hasher = _new_keccak()
+        return hasher.digest(data)
+
+    def hash_pair(self, a: bytes, b: bytes) -> bytes:
+        if b < a:
+            a, b = b, a
+        return self.digest(hexlify(a + b))
+
+    def hash_ordered_pair(self, a: bytes, b: bytes) -> bytes:
+        return self.digest(hexlify(a + b))
+
+    def hash_hex_pair(self, a: str, b: str) -> str:
+        if b < a:
+            a, b = b, a
+        return self.digest((a + b).encode()).hex()
+
+
+class Sha3Backend(HashBackend):
+    """SHA3-256 of the raw pair."""
+
+    name = "sha3_256"
+    backend_id = 2
+
+    def digest(self, data: bytes) -> bytes:
+        return hashlib.sha3_256(data).digest()
+
+
+class Blake2bBackend(HashBackend):
+    """BLAKE2b, truncated to 32 bytes, of the raw pair."""
+
+    name = "blake2b"
+    backend_id = 3
+
+    def digest(self, data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class Blake2sBackend(HashBackend):
+    """BLAKE2s of the raw pair."""
+
+    name = "blake2s"
+    backend_id = 4
+
+    def digest(self, data: bytes) -> bytes:
+        return hashlib.blake2s(data).digest()
+
+
+class Sha256dBackend(HashBackend):
+    """SHA-256 applied twice to the raw pair."""
+
+    name = "sha256d"
+    backend_id = 5
+
+    def digest(self, data: bytes) -> bytes:
+        return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+HASH_BACKENDS: Dict[str, Type[HashBackend]] = {
+    backend.name: backend
+    for backend in (
+        KeccakBackend,
+        Sha3Backend,
+        Blake2bBackend,
+        Blake2sBackend,
+        Sha256dBackend,
+    )
+}
+
+
+def register_hash_backend(backend: Type[HashBackend]) -> None:
+    """Register a hash backend under its name.
+
+    Args:
+        backend (Type[HashBackend]): The backend class.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: The backend has no name, or its name or id is already
+            used.
+    """
+    if not backend.name or backend.name in HASH_BACKENDS:
+        raise ValueError(f"Invalid hash backend name {backend.name!r}!")
+    if not 0 <= backend.backend_id <= 255:
+        raise ValueError(f"Invalid hash backend id {backend.backend_id}!")
+    if backend.backend_id and any(
+        other.backend_id == backend.backend_id for other in HASH_BACKENDS.values()
+    ):
+        raise ValueError(f"Hash backend id {backend.backend_id} already used!")
+    HASH_BACKENDS[backend.name] = backend
+
+
+def get_hash_backend(name: str) -> HashBackend:
+    """Get a new instance of a hash backend.
+
+    Args:
+        name (str): The name of the backend.
+
+    Returns:
+        HashBackend: The backend.
+
+    Raises:
+        ValueError: No backend registered under ``name``.
+    """
+    try:
+        return HASH_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown hash backend {name!r}!")
+
+
+def get_hash_backend_name(backend_id: int) -> str:
+    """Get the name of the hash backend registered under an id.
+
+    Args:
+        backend_id (int): The id of the backend.
+
+    Returns:
+        str: The name of the backend.
+
+    Raises:
+        ValueError: No backend registered under ``backend_id``.
+    """
+    for name, backend in HASH_BACKENDS.items():
+        if backend_id and backend.backend_id == backend_id:
+            return name
+    raise ValueError(f"Unknown hash backend id {backend_id}!")
+
+
+def hash_backend_names() -> List[str]:
+    """Get the names of the registered hash backends.
+
+    Returns:
+        list[str]: The names of the backends.
+    """
+    return list(HASH_BACKENDS)
@@ -0,0 +1,208 @@
+"""
+Instrumentation of the Merkle Tree application.
+
+A ``MerkleObserver`` given to a ``MerkleTree`` is told about the work done
+by the tree: the pairs hashed, the time spent on each level of a build and
+the latency of the proofs and verifications. ``MerkleStats`` is an
+observer keeping counters and latency histograms. Without an observer, the
+tree only checks that there is none.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import threading
+from typing import Any, Dict
+
+
+class MerkleObserver:
+    """
+    Base class of the observers of a merkle tree, doing nothing.
+
+    The methods are called by the thread doing the work.
+    """
+
+    def on_hashes(
+        self, hashes: int, bytes_hashed: int, nodes: int, proof_entries: int
+    ) -> None:
+        """Pairs of nodes were hashed.
+
+        Args:
+            hashes (int): The number of pairs hashed.
+            bytes_hashed (int): The number of bytes hashed.
+            nodes (int): The number of nodes written in the tree.
+            proof_entries (int): The number of entries set in ``_proofs``.
+
+        Returns:
+            None
+        """
+
+    def on_build_level(self, level: int, seconds: float) -> None:
+        """A level of the tree was built.
+
+        Args:
+            level (int): The level built, 1 for the parents of the leaves.
+            seconds (float): The time spent on the level.
+
+        Returns:
+            None
+        """
+
+    def on_proof(self, seconds: float) -> None:
+        """A proof was provided.
+
+        Args:
+            seconds (float): The time spent on the proof.
+
+        Returns:
+            None
+        """
+
+    def on_verify(self, seconds: float) -> None:
+        """A proof was checked.
+
+        Args:
+            seconds (float): The time spent on the proof.
+
+        Returns:
+            None
+        """
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the statistics collected by the observer.
+
+        Returns:
+            dict: The statistics, empty for this observer.
+        """
+        return {}
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies with power of 2 buckets, in microseconds.
+
+    The bucket ``2**i`` counts the latencies from ``2**(i-1)`` (excluded)
+    to ``2**i`` microseconds, so the percentiles are upper bounds at most
+    twice the actual latency.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Add a latency to the histogram.
+
+        Args:
+            seconds (float): The latency.
+
+        Returns:
+            None
+        """
+        bucket = 1 << max(int(seconds * 1e6) - 1, 0).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Get the upper bound of a percentile of the latencies.
+
+        Args:
+            percent (float): The percentile, from 0 to 100.
+
+        Returns:
+            float: The upper bound of the bucket of the percentile, in
+                microseconds, 0 if no latency.
+        """
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return float(bucket)
+        return 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the statistics of the histogram.
+
+        Returns:
+            dict: The count, mean, p50, p99, max (microseconds) and buckets.
+        """
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count * 1e6 if self.count else 0.0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "max_us": self.max * 1e6,
+            "buckets": dict(sorted(self.buckets.items())),
+        }
+
+
+class MerkleStats(MerkleObserver):
+    """
+    An observer keeping counters, build timings and latency histograms.
+
+    It can be shared by several trees and threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the statistics collected.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.hash_calls = 0
+            self.bytes_hashed = 0
+            self.nodes_written = 0
+            self.proof_entries = 0
+            self.level_seconds: Dict[int, float] = {}
+            self.proofs = LatencyHistogram()
+            self.verifies = LatencyHistogram()
+
+    def on_hashes(
+        self, hashes: int, bytes_hashed: int, nodes: int, proof_entries: int
+    ) -> None:
+        with self._lock:
+            self.hash_calls += hashes
+            self.bytes_hashed += bytes_hashed
+            self.nodes_written += nodes
+            self.proof_entries += proof_entries
+
+    def on_build_level(self, level: int, seconds: float) -> None:
+        with self._lock:
+            self.level_seconds[level] = (
+                self.level_seconds.get(level, 0.0) + seconds
+            )
+
+    def on_proof(self, seconds: float) -> None:
+        with self._lock:
+            self.proofs.add(seconds)
+
+    def on_verify(self, seconds: float) -> None:
+        with self._lock:
+            self.verifies.add(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the statistics collected.
+
+        Returns:
+            dict: The counters, the seconds spent on each level of the
+                builds and the latencies of the proofs and verifications.
+        """
+        with self._lock:
+            return {
+                "hash_calls": self.hash_calls,
+                "bytes_hashed": self.bytes_hashed,
+                "nodes_written": self.nodes_written,
+                "proof_entries": self.proof_entries,
+                "build_level_seconds": dict(sorted(self.level_seconds.items())),
+                "proof_latency": self.proofs.snapshot(),
+                "verify_latency": self.verifies.snapshot(),
+            }
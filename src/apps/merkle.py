@@ -4,12 +4,76 @@ A simple Merkle Tree application.
 Author:
 Arnaud SENE, arnaud.sene@pm.me
 """
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+import sys
+from array import array
+from binascii import hexlify
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass, field, fields
+from itertools import chain, count, islice, repeat
+from tempfile import TemporaryFile
+from time import perf_counter
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from Crypto.Hash import keccak
 
+from src.apps.cache import Proof, ProofCache
+from src.apps.hashing import (
+    DIGEST_SIZE,
+    HashBackend,
+    KeccakBackend,
+    get_hash_backend,
+)
+from src.apps.instrumentation import MerkleObserver
+from src.apps.storage import (
+    LevelsView,
+    NodesView,
+    pack_proof,
+    read_tree_file,
+    unpack_proof,
+    write_tree_file,
+)
 
-@dataclass
+_KECCAK = KeccakBackend()
+
+# Unique generation of every built or changed tree, see ``ProofCache``
+_GENERATIONS = count(1)
+
+# Flags of a multi proof: how the next node of the queue is hashed
+MULTI_PROOF_SIBLING = 0  # with the next node of the proof
+MULTI_PROOF_PAIR = 1  # with the next node of the queue
+MULTI_PROOF_PROMOTE = 2  # not hashed, promoted to the next level
+
+
+@dataclass(frozen=True)
+class Subtree:
+    """
+    The root of a subtree of a merkle tree, built on another host.
+
+    The subtree holds the leaves ``start`` to ``start + leaf_count - 1``
+    of the merkle tree.
+    """
+
+    start: int
+    leaf_count: int
+    root: str
+    hash_backend: str = KeccakBackend.name
+
+
+@dataclass(slots=True)
 class MerkleTree:
     """
     Class to build a Merkle Tree.
@@ -19,12 +83,84 @@ class MerkleTree:
         - to create a proof structure (automatically)
         - to verify a data in merkle tree
         - to get informations as (size, depth, etc.)
+
+    Each level of the tree is kept in its own growable buffer (``_levels``,
+    the leaves first), so appending a leaf only writes the right edge of
+    the tree. The odd node of a level is promoted as is to the next level,
+    and stored only once, at the lowest level it appears.
+
+    With ``binary=True`` the nodes are kept as raw 32-byte digests, a
+    ``bytearray`` per level, and converted to hex strings only when they
+    leave the tree: ``get_leaves`` and ``get_merkle_tree`` return read-only
+    views (``NodesView``) of the nodes. The leaves must then be lowercase
+    hex encoded 32-byte digests.
+
+    ``hash_backend`` is the name of the hash backend of the nodes (see
+    ``src.apps.hashing``), ``keccak`` by default.
+
+    With ``build_proofs=False`` the ``_proofs`` structure, keyed by node,
+    is not built: proofs are read from the levels of the tree by leaf
+    index, which is the only way in binary mode.
+
+    With a ``proof_cache``, the proofs are cached and returned as tuples.
+    Every build or change of the tree gives it a new generation, which
+    invalidates the cached proofs.
+
+    An ``observer`` (see ``src.apps.instrumentation``) is told about the
+    pairs hashed, the time spent on each level of the builds and the
+    latency of the proofs and verifications.
+
+    With ``leaf_index=True``, the positions of the leaves are indexed. In
+    hex mode ``_index`` maps each leaf, the string of the tree itself, to
+    its position or to the sorted positions of the leaves equal to it. In
+    binary mode the 8-byte prefixes of the digests are sorted in a packed
+    array (``_index_keys``) next to the positions of their leaves
+    (``_index_positions``), and ``_index`` maps the prefixes of the leaves
+    appended or changed since to their positions. The leaves sharing a
+    prefix are compared to the leaf looked up. ``contains``, ``index_of``
+    and the proofs by leaf then no longer scan the leaves.
     """
 
-    _merkle_tree: list[str] = field(default_factory=list)
-    _leaves: List[str] = field(default_factory=list)
+    _levels: List[Any] = field(default_factory=list)
     _depth: int = 1
     _proofs: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    binary: bool = False
+    build_proofs: bool = True
+    hash_backend: str = KeccakBackend.name
+    proof_cache: Optional[ProofCache] = field(
+        default=None, repr=False, compare=False
+    )
+    observer: Optional[MerkleObserver] = field(
+        default=None, repr=False, compare=False
+    )
+    leaf_index: bool = False
+    _index: Dict[Any, Any] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    _index_keys: array = field(
+        default_factory=lambda: array("Q"), repr=False, compare=False
+    )
+    _index_positions: array = field(
+        default_factory=lambda: array("Q"), repr=False, compare=False
+    )
+    _generation: int = field(default=0, repr=False, compare=False)
+    _backend: HashBackend = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._backend = get_hash_backend(self.hash_backend)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The levels of an opened tree are views of the file, copied here
+        state = {item.name: getattr(self, item.name) for item in fields(self)}
+        state["_levels"] = [
+            bytearray(level) if isinstance(level, memoryview) else level
+            for level in self._levels
+        ]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def count_leaves(self) -> int:
         """Count the number of leaves in the merkle tree.
@@ -32,23 +168,36 @@ class MerkleTree:
         Returns:
             int: The number of leaves.
         """
-        return len(self._leaves)
+        if not self._levels:
+            return 0
+        if self.binary:
+            return len(self._levels[0]) // DIGEST_SIZE
+        return len(self._levels[0])
 
-    def get_leaves(self) -> List[str]:
+    def get_leaves(self) -> Sequence[str]:
         """Get the leaves in the merkle tree.
 
         Returns:
-            list[str]: A list of leaves.
+            list[str]: A list of leaves, a read-only view in binary mode.
         """
-        return self._leaves
+        if not self._levels:
+            return NodesView(b"") if self.binary else []
+        if self.binary:
+            return NodesView(self._levels[0])
+        return self._levels[0]
 
-    def get_merkle_tree(self):
+    def get_merkle_tree(self) -> Sequence[str]:
         """Get the merkle tree structure.
 
+        The levels are not copied: the view reads each node from its
+        level, leaves first, and costs ``O(depth)`` to create.
+
         Returns:
-            list[str]: A merkle tree structure.
+            Sequence[str]: A read-only view of the merkle tree structure.
         """
-        return self._merkle_tree
+        if self.binary:
+            return NodesView.of_levels(self._levels)
+        return LevelsView(self._levels)
 
     def get_depth(self) -> int:
         """Get the depth of the merkle tree.
@@ -66,7 +215,26 @@ class MerkleTree:
         Returns:
             int: The number of elements in the merkle tree.
         """
-        return len(self.get_merkle_tree())
+        size = sum(map(len, self._levels))
+        return size // DIGEST_SIZE if self.binary else size
+
+    def get_generation(self) -> int:
+        """Get the generation of the merkle tree.
+
+        Returns:
+            int: A number changed by every build or change of the tree.
+        """
+        return self._generation
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the statistics collected by the ``observer``.
+
+        Returns:
+            dict: The statistics, empty without observer.
+        """
+        if self.observer is None:
+            return {}
+        return self.observer.snapshot()
 
     def get_root_tree(self) -> str:
         """Get the root of the Merkle tree.
@@ -74,31 +242,92 @@ class MerkleTree:
         Returns:
             str: The merkle tree root.
         """
-        try:
-            return self.get_merkle_tree()[-1]
-        except IndexError:
+        if not self._levels:
             raise IndexError("No merkle tree found!")
+        # The top level holds the root only
+        if self.binary:
+            return bytes(self._levels[-1]).hex()
+        return self._levels[-1][0]
 
-    def build_merkle_tree(self, values: list[str]) -> None:
+    def build_merkle_tree(
+        self,
+        values: list[str],
+        executor: Optional[Executor] = None,
+        chunk_size: int = 2 ** 16,
+    ) -> None:
         """Build a merkle tree.
 
+        With an ``executor`` (a thread or process pool), the leaves are
+        split in subtrees of ``chunk_size`` leaves hashed concurrently, then
+        the roots of the subtrees are merged. The tree is the same as the
+        one built without executor.
+
         Args:
             values (list[str]): The values required to build the merkle tree.
+            executor (Executor): The pool used to hash the subtrees.
+            chunk_size (int): The number of leaves of a subtree, a power of 2.
 
         Returns:
             None
 
         Raises:
-            ValueError: No ``values`` provided.
+            ValueError: No ``values`` provided or ``chunk_size`` is not a
+                power of 2.
         """
-        self._build_merkle_tree(values)
+        self._generation = next(_GENERATIONS)
+        if executor is not None:
+            if chunk_size < 2 or chunk_size & (chunk_size - 1):
+                raise ValueError("chunk_size must be a power of 2!")
 
-    def _build_merkle_tree(self, values: list[str], offset: int = 0) -> None:
+        if executor is not None and len(values) > chunk_size:
+            self._build_parallel(values, executor, chunk_size)
+        elif self.binary:
+            self._build_binary_tree(values)
+        else:
+            self._build_merkle_tree(values)
+
+        self._build_index()
+
+    def _build_binary_tree(self, values: list[str]) -> None:
+        """Build a merkle tree made of raw digests.
+
+        Every level is hashed in a ``bytearray`` of its own, of the size
+        given by ``_level_sizes``.
+
+        Args:
+            values (list[str]): The hex encoded digests to build the tree.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: No ``values`` provided or a value is not a digest.
+        """
+        if not values:
+            raise ValueError("No value provided!")
+
+        sizes = self._level_sizes(len(values))
+        levels = [bytearray(self._decode_digests(values))]
+        self._hash_digest_levels(
+            levels,
+            b"",
+            sizes[1:],
+            self._backend.hash_pair,
+            self._level_observer(1),
+        )
+
+        self._levels = levels
+        self._depth = len(sizes)
+
+    def _build_merkle_tree(self, values: list[str]) -> None:
         """Build a merkle tree.
 
+        The levels are built one after the other, without recursion, each
+        level of hashes in a list allocated once with its final size. A
+        previous tree is discarded.
+
         Args:
             values (list[str]): The values required to build the merkle tree.
-            offset (int): The offset value (offset)
 
         Returns:
             None
@@ -109,42 +338,532 @@ class MerkleTree:
         if not values:
             raise ValueError("No value provided!")
 
-        # Init merkle tree with leaves
-        if len(self.get_merkle_tree()) == 0:
-            self._merkle_tree = values.copy()
-            self._leaves = values.copy()
+        sizes = self._level_sizes(len(values))
+        levels = [values.copy()]
+        proofs: Dict[str, Tuple[str, str]] = {}
+        self._hash_levels(
+            values,
+            levels,
+            sizes[1:],
+            proofs if self.build_proofs else None,
+            self._backend.hash_hex_pair,
+            self._level_observer(1),
+        )
 
-        # Copy of values (leaves)
-        values_copy = values.copy()
-        new_values: list[str] = []
-        _offset = offset
-        offset = len(self.get_merkle_tree())
+        self._levels = levels
+        self._proofs = proofs
+        self._depth = len(sizes)
 
-        # Count depth of merkle
-        if len(values_copy) >= 2:
-            self._depth += 1
+    def _build_parallel(
+        self, values: list[str], executor: Executor, chunk_size: int
+    ) -> None:
+        """Build a merkle tree from subtrees hashed by an executor.
 
-        for i in range(0, len(values_copy), 2):
-            pair = values_copy[i:i + 2]
+        The subtrees are aligned on ``chunk_size`` (a power of 2), so no
+        pair crosses two subtrees below their roots: each lower level of
+        the tree is the concatenation of this level of the subtrees.
 
-            if len(pair) == 2:
-                hash = self._hash_pair(pair[0], pair[1])
+        Args:
+            values (list[str]): The values required to build the merkle tree.
+            executor (Executor): The pool used to hash the subtrees.
+            chunk_size (int): The number of leaves of a subtree.
 
-                # Create proofs
-                self._proofs[pair[0]] = (pair[1], hash)
-                self._proofs[pair[1]] = (pair[0], hash)
+        Returns:
+            None
+
+        Raises:
+            ValueError: A value is not a digest (binary mode).
+        """
+        chunks = [
+            values[i:i + chunk_size] for i in range(0, len(values), chunk_size)
+        ]
+        subtrees = list(
+            executor.map(
+                _build_subtree,
+                chunks,
+                repeat(self.binary),
+                repeat(self.build_proofs),
+                repeat(self.hash_backend),
+            )
+        )
+
+        sizes = self._level_sizes(len(values))
+        height = chunk_size.bit_length()
+        if self.observer is not None:
+            # The levels hashed by the workers, not timed one by one
+            self._observe_hashes(sum(sizes[1:height]))
+
+        # Levels below the roots of the subtrees, then the roots level. A
+        # small last subtree has less levels, and its root is promoted.
+        levels: List[Any] = []
+        for level in range(height):
+            parts = [tree[level] for tree, _ in subtrees if level < len(tree)]
+            if self.binary:
+                levels.append(bytearray(b"".join(parts)))
+            else:
+                levels.append([node for part in parts for node in part])
+        last_tree, _ = subtrees[-1]
+        promoted = len(last_tree) < height
+
+        if self.binary:
+            self._hash_digest_levels(
+                levels,
+                bytes(last_tree[-1]) if promoted else b"",
+                sizes[height:],
+                self._backend.hash_pair,
+                self._level_observer(height),
+            )
+        else:
+            proofs: Dict[str, Tuple[str, str]] = {}
+            for _, subtree_proofs in subtrees:
+                proofs.update(subtree_proofs)
+            roots = [tree[-1][0] for tree, _ in subtrees]
+            self._hash_levels(
+                roots,
+                levels,
+                sizes[height:],
+                proofs if self.build_proofs else None,
+                self._backend.hash_hex_pair,
+                self._level_observer(height),
+            )
+            self._proofs = proofs
+        self._levels = levels
+
+        self._depth = len(sizes)
+
+    def append_leaf(self, value: str) -> None:
+        """Append a leaf to the merkle tree.
+
+        Args:
+            value (str): The leaf to append.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The value is not a digest (binary mode).
+        """
+        self.append_leaves([value])
+
+    def append_leaves(self, values: List[str]) -> None:
+        """Append leaves to the merkle tree.
+
+        Only the right edge of the tree is written and hashed again: the
+        new leaves and the last node of each level, which was waiting for a
+        sibling. Each level grows in place, with the amortized growth of
+        its list or ``bytearray``, so appending a leaf costs ``O(log n)``.
+        The tree and the root are the same as a build over all the leaves.
+
+        Args:
+            values (list[str]): The leaves to append.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: No ``values`` provided or a value is not a digest
+                (binary mode).
+        """
+        if not values:
+            raise ValueError("No value provided!")
+
+        count = self.count_leaves()
+        if count == 0:
+            self.build_merkle_tree(values)
+            return
+
+        duplicates = self._has_duplicate_nodes()
+        old_sizes = self._level_sizes(count)
+        sizes = self._level_sizes(count + len(values))
+        raw = self._decode_digests(values) if self.binary else b""
+
+        # Every level gets room at its end for the nodes hashed again
+        levels = self._levels
+        for level, size in enumerate(sizes):
+            if level == len(levels):
+                levels.append(bytearray() if self.binary else [])
+            added = size - (old_sizes[level] if level < len(old_sizes) else 0)
+            if self.binary:
+                nodes = raw if level == 0 else bytes(DIGEST_SIZE * added)
+                if not isinstance(levels[level], bytearray):
+                    # A level of a tree file, copied once
+                    levels[level] = bytearray(levels[level])
+                try:
+                    levels[level] += nodes
+                except BufferError:
+                    # A view of the level is held (``get_leaves``,
+                    # ``get_merkle_tree``), which keeps the nodes before
+                    # the append
+                    levels[level] = levels[level] + nodes
+            else:
+                levels[level].extend(values if level == 0 else [""] * added)
+
+        self._depth = len(sizes)
+        self._rehash(range(count, count + len(values)), duplicates=duplicates)
+        if self.leaf_index:
+            self._index_leaves(range(count, count + len(values)))
+
+    def update_leaf(self, index: int, value: str) -> None:
+        """Replace a leaf of the merkle tree.
+
+        Args:
+            index (int): The position of the leaf.
+            value (str): The new leaf.
+
+        Returns:
+            None
+
+        Raises:
+            IndexError: No leaf at ``index``.
+            ValueError: The value is not a digest (binary mode).
+        """
+        self.update_leaves({index: value})
+
+    def update_leaves(self, values: Dict[int, str]) -> None:
+        """Replace leaves of the merkle tree.
+
+        Only the ancestors of the leaves replaced are hashed again, once
+        each even when they are shared by several leaves.
+
+        Args:
+            values (dict[int, str]): The new leaves by position.
+
+        Returns:
+            None
+
+        Raises:
+            IndexError: No leaf at a position.
+            ValueError: A value is not a digest (binary mode).
+        """
+        count = self.count_leaves()
+        for index in values:
+            if not 0 <= index < count:
+                raise IndexError(f"No leaf at index {index}!")
+
+        if self.binary:
+            raw = self._decode_digests(list(values.values()))
+        if self.leaf_index:
+            self._unindex_leaves(values)
+        duplicates = self._has_duplicate_nodes()
+        removed = []
+
+        leaves = self._levels[0]
+        if self.binary:
+            for i, index in enumerate(values):
+                start = index * DIGEST_SIZE
+                leaves[start:start + DIGEST_SIZE] = raw[
+                    i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE
+                ]
+        else:
+            for index, value in values.items():
+                old = leaves[index]
+                if old != value:
+                    self._proofs.pop(old, None)
+                    removed.append(old)
+                leaves[index] = value
+
+        self._rehash(values, removed, duplicates)
+        if self.leaf_index:
+            self._index_leaves(values)
+
+    def _rehash(
+        self,
+        dirty: Iterable[int],
+        removed: Iterable[str] = (),
+        duplicates: bool = False,
+    ) -> None:
+        """Hash again the ancestors of the dirty leaves.
+
+        The dirty positions are walked up level by level, so an ancestor
+        shared by several leaves is hashed once. ``_proofs`` is updated for
+        every pair hashed again, and the entries of the replaced hashes are
+        removed. When a node is at several positions of the tree, before
+        or after the change, the entries touched are set again like a build
+        would, see ``_reset_proofs``.
+
+        Args:
+            dirty (Iterable[int]): The positions of the leaves changed.
+            removed (Iterable[str]): The leaves replaced, whose entries are
+                removed.
+            duplicates (bool): A node was at several positions of the tree
+                before the change.
+
+        Returns:
+            None
+        """
+        self._generation = next(_GENERATIONS)
+        count = self.count_leaves()
+        sizes = self._level_sizes(count)
+        proofs = self._proofs
+        with_proofs = self.build_proofs and not self.binary
+        touched: Set[str] = set(removed)
+
+        read, write, hash_pair = self._node_accessors()
+
+        hashes = 0
+        level = 0
+        positions = set(dirty)
+        while count > 1:
+            parents = set()
+            for parent in sorted({i // 2 for i in positions}):
+                parents.add(parent)
+                if 2 * parent + 1 >= count:
+                    # The odd node is promoted as is
+                    continue
+
+                a = read(*self._node_position(sizes, level, 2 * parent))
+                b = read(*self._node_position(sizes, level, 2 * parent + 1))
+                hash = hash_pair(a, b)
+                if with_proofs:
+                    old = read(level + 1, parent)
+                    if old and old != hash:
+                        proofs.pop(old, None)
+                        touched.add(old)
+                    proofs[a] = (b, hash)
+                    proofs[b] = (a, hash)
+                    touched.add(a)
+                    touched.add(b)
+                write(level + 1, parent, hash)
+                hashes += 1
+
+            positions = parents
+            count = (count + 1) // 2
+            level += 1
+
+        if with_proofs and (duplicates or self._has_duplicate_nodes()):
+            self._reset_proofs(touched)
+        if self.observer is not None:
+            self._observe_hashes(hashes)
+
+    def _has_duplicate_nodes(self) -> bool:
+        """Check if a node is at several positions of the merkle tree.
+
+        Every node but the root is paired once, so the ``_proofs`` of
+        ``n`` distinct leaves and their ancestors hold ``2 * (n - 1)``
+        entries, and fewer when nodes are equal.
+
+        Returns:
+            bool: True if ``_proofs`` holds fewer entries than nodes.
+        """
+        return len(self._proofs) < 2 * (self.count_leaves() - 1)
 
-                # Add hash to merkle tree
-                self._merkle_tree.append(hash)
-                _offset += 2
+    def _reset_proofs(self, keys: Set[str]) -> None:
+        """Set the ``_proofs`` entries of nodes like a build of the tree.
 
+        A node at several positions keeps the entry of its last pair in
+        the order of the build, level after level, and a node no longer in
+        the tree loses its entry. Every level is walked, so it is only done
+        when the tree has equal nodes.
+
+        Args:
+            keys (set[str]): The nodes whose entries are set again.
+
+        Returns:
+            None
+        """
+        entries: Dict[str, Tuple[str, str]] = {}
+        levels = self._levels
+        carry: List[str] = []
+        for level, parents in enumerate(levels[1:]):
+            nodes = levels[level]
+            pairs = chain(nodes, carry)
+            for parent, a, b in zip(parents, pairs, pairs):
+                if a in keys:
+                    entries[a] = (b, parent)
+                if b in keys:
+                    entries[b] = (a, parent)
+            if (len(nodes) + len(carry)) % 2:
+                # The odd node is promoted as is
+                carry = carry or [nodes[-1]]
+            else:
+                carry = []
+
+        proofs = self._proofs
+        for key in keys:
+            if key in entries:
+                proofs[key] = entries[key]
             else:
-                hash = pair[0]
+                proofs.pop(key, None)
+
+    @staticmethod
+    def root_from_stream(
+        leaves: Iterable[str],
+        chunk_size: int = 2 ** 16,
+        hash_backend: str = KeccakBackend.name,
+        path: Optional[str] = None,
+    ) -> str:
+        """Get the root of the merkle tree of a stream of leaves.
+
+        Only the roots of the complete subtrees on the right edge are kept
+        in memory (see ``MerkleTreeBuilder``), whatever the number of
+        leaves. The root is the same as with ``build_merkle_tree``.
+
+        Args:
+            leaves (Iterable[str]): The leaves, or a text file with a leaf
+                per line.
+            chunk_size (int): The number of leaves read at once.
+            hash_backend (str): The name of the hash backend.
+            path (str): Also write the tree in this file, see ``open``.
+
+        Returns:
+            str: The merkle tree root.
+
+        Raises:
+            ValueError: No leaf provided or a leaf is not a digest (with
+                ``path``).
+        """
+        if hasattr(leaves, "read"):
+            leaves = (line.rstrip("\r\n") for line in leaves)
+
+        builder = MerkleTreeBuilder(hash_backend, path)
+        iterator = iter(leaves)
+        while chunk := list(islice(iterator, chunk_size)):
+            builder.add_leaves(chunk)
+        return builder.get_root_tree()
+
+    def save(self, path: str) -> None:
+        """Save the merkle tree in a file.
+
+        The file holds the raw nodes and the name of the hash backend, see
+        ``src.apps.storage`` for the format.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            None
+
+        Raises:
+            IndexError: No merkle tree found.
+            ValueError: A node is not a hex encoded digest.
+        """
+        count = self.count_leaves()
+        if count == 0:
+            raise IndexError("No merkle tree found!")
+
+        # The contiguous layout of the file, a level after the other
+        if self.binary:
+            levels = self._levels
+        else:
+            levels = [self._decode_digests(level) for level in self._levels]
+        offsets = self._level_offsets(self._level_sizes(count))
+        write_tree_file(path, levels, count, offsets, self.hash_backend)
 
-            new_values.append(hash)
+    @classmethod
+    def open(
+        cls, path: str, mmap: bool = True, leaf_index: bool = False
+    ) -> "MerkleTree":
+        """Open a merkle tree saved in a file.
 
-        if len(new_values) > 1:
-            self._build_merkle_tree(new_values, offset)
+        The tree is in binary mode, without ``_proofs``. With ``mmap`` the
+        nodes are served from the file mapped in memory: opening does not
+        depend on the size of the tree. The tree can still be changed, in
+        memory only, and a level is copied in memory the first time leaves
+        are appended. A pickled or copied tree gets its levels in memory.
+
+        Args:
+            path (str): The path of the file.
+            mmap (bool): Map the file in memory instead of reading it.
+            leaf_index (bool): Index the leaves, which reads all of them.
+
+        Returns:
+            MerkleTree: The merkle tree.
+
+        Raises:
+            ValueError: The file is not a merkle tree file.
+        """
+        nodes, leaf_count, offsets, hash_backend = read_tree_file(path, mmap)
+        sizes = cls._level_sizes(leaf_count)
+        if offsets != cls._level_offsets(sizes) \
+                or len(nodes) != DIGEST_SIZE * sum(sizes):
+            raise ValueError(f"{path} is corrupted!")
+
+        tree = cls(
+            binary=True,
+            build_proofs=False,
+            hash_backend=hash_backend,
+            leaf_index=leaf_index,
+        )
+        view = memoryview(nodes)
+        tree._levels = [
+            view[DIGEST_SIZE * offset:DIGEST_SIZE * (offset + size)]
+            for offset, size in zip(offsets, sizes)
+        ]
+        tree._depth = len(sizes)
+        tree._generation = next(_GENERATIONS)
+        tree._build_index()
+        return tree
+
+    def export_subtree(self, start: int) -> Subtree:
+        """Export the root of the tree, as a subtree of a larger tree.
+
+        The tree holds the leaves of the larger tree from ``start``: see
+        ``combine``.
+
+        Args:
+            start (int): The position of the first leaf in the larger tree.
+
+        Returns:
+            Subtree: The root and the range of leaves of the tree.
+
+        Raises:
+            IndexError: Merkle tree not created.
+        """
+        return Subtree(
+            start, self.count_leaves(), self.get_root_tree(), self.hash_backend
+        )
+
+    @classmethod
+    def combine(
+        cls, subtrees: Iterable[Subtree], **options: Any
+    ) -> "MerkleTree":
+        """Build the upper tree of subtrees built on several hosts.
+
+        The subtrees must hold the same power of 2 number of leaves, but
+        the last one which may hold less, and cover the leaves without gap.
+        No pair of the larger tree then crosses two subtrees below their
+        roots, so its upper levels are the tree of the roots of the
+        subtrees: the root of the upper tree is the root of the larger
+        tree, and the proof of a leaf is its proof in its subtree followed
+        by the proof of the subtree in the upper tree::
+
+            shard.get_merkle_proof_at(i) + upper.get_merkle_proof_at(n)
+
+        Args:
+            subtrees (Iterable[Subtree]): The subtrees, in any order.
+            options: The options of the upper tree (``binary``, ...).
+
+        Returns:
+            MerkleTree: The upper tree, the roots of the subtrees as leaves.
+
+        Raises:
+            ValueError: No subtree, subtrees of different hash backends or
+                not aligned on a power of 2.
+        """
+        subtrees = sorted(subtrees, key=lambda subtree: subtree.start)
+        if not subtrees:
+            raise ValueError("No subtree provided!")
+
+        size = subtrees[0].leaf_count
+        hash_backend = subtrees[0].hash_backend
+        if len(subtrees) > 1 and size & (size - 1):
+            raise ValueError("Subtrees must hold a power of 2 leaves!")
+        for number, subtree in enumerate(subtrees):
+            if subtree.hash_backend != hash_backend:
+                raise ValueError("The subtrees have different hash backends!")
+            if subtree.start != number * size:
+                raise ValueError(f"No subtree at leaf {number * size}!")
+            last = number == len(subtrees) - 1
+            if not 0 < subtree.leaf_count <= size or (
+                not last and subtree.leaf_count != size
+            ):
+                raise ValueError(
+                    f"The subtree at leaf {subtree.start} must hold {size} leaves!"
+                )
+
+        tree = cls(hash_backend=hash_backend, **options)
+        tree.build_merkle_tree([subtree.root for subtree in subtrees])
+        return tree
 
     def get_merkle_proof(self, leaf: str):
         """Get the merkle tree proof structure.
@@ -153,98 +872,1602 @@ class MerkleTree:
             leaf (str): The leaf's proof to provide
 
         Returns:
-            list[str]: The merkle tree proof structure
+            list[str]: The merkle tree proof structure, a tuple with a
+                ``proof_cache``.
         """
-        return self._get_merkle_proof(leaf)
+        observer = self.observer
+        start = perf_counter() if observer is not None else 0.0
+        proof: Sequence[str]
+        if self.proof_cache is not None:
+            proof = self._cached_proof(leaf, self._find_proof)
+        else:
+            proof = self._find_proof(leaf)
+        if observer is not None:
+            observer.on_proof(perf_counter() - start)
+        return proof
 
-    def _get_merkle_proof(self, leaf: str, values: Optional[List[str]] = None):
-        """Get the merkle tree proof structure.
+    def _find_proof(self, leaf: str) -> List[str]:
+        """Get the merkle tree proof structure, without cache.
 
         Args:
             leaf (str): The leaf's proof to provide
-            values (list[str]): The proof values
 
         Returns:
             list[str]: The merkle tree proof structure
         """
-        if values is None:
-            values = []
-
-        hash = None
-        if self._proofs.get(leaf) is not None:
-            value, hash = self._proofs[leaf]
-            values.append(value)
+        if self.build_proofs and not self.binary and not self.leaf_index:
+            return self._get_merkle_proof(leaf)
 
-        if hash:
-            self._get_merkle_proof(hash, values)
+        index = self._find_leaf(leaf)
+        if index < 0:
+            return []
+        return self._proof_at(index)
 
-        return values
+    def get_merkle_proof_at(self, index: int) -> Sequence[str]:
+        """Get the merkle tree proof structure of the leaf at ``index``.
 
-    def verify(self, proof: list[str], root_tree: str, leaf: str) -> bool:
-        """Check that a value is part of the merkle tree.
+        The siblings are read level after level from their positions in
+        the levels, so duplicate leaves each get their own proof.
 
         Args:
-            proofs (list[str]): The proofs values.
-            root_tree (str): The merkle tree root.
-            leaf (str): The value to check.
+            index (int): The position of the leaf.
 
         Returns:
-            True if the value is part of the merkle tree.
+            list[str]: The merkle tree proof structure, a tuple with a
+                ``proof_cache``.
+
+        Raises:
+            IndexError: No leaf at ``index``.
         """
-        return self._verify(proof, leaf) == root_tree
+        if not 0 <= index < self.count_leaves():
+            raise IndexError(f"No leaf at index {index}!")
 
-    def _verify(self, proof: list[str], leaf: str):
-        """Build a merkle tree root based on values provided.
+        observer = self.observer
+        start = perf_counter() if observer is not None else 0.0
+        proof: Sequence[str]
+        if self.proof_cache is not None:
+            proof = self._cached_proof(index, self._proof_at)
+        else:
+            proof = self._proof_at(index)
+        if observer is not None:
+            observer.on_proof(perf_counter() - start)
+        return proof
+
+    def _cached_proof(
+        self, key: Any, get_proof: Callable[[Any], List[str]]
+    ) -> Proof:
+        """Get a proof from the ``proof_cache``, or cache it.
 
         Args:
-            proofs (list[str]): The proofs values.
-            leaf (str): The value to check.
+            key (Any): The leaf or the position of the proof.
+            get_proof (Callable): Get the proof of ``key`` if not cached.
 
         Returns:
-            The merkle tree root.
+            tuple: The merkle tree proof structure.
         """
-        computed_hash = leaf
-        for i in proof:
-            computed_hash = self._hash_pair(computed_hash, i)
+        cache = self.proof_cache
+        assert cache is not None
+        generation = self._generation
+        proof = cache.get(key, generation)
+        if proof is None:
+            proof = tuple(get_proof(key))
+            cache.put(key, proof, generation)
+        return proof
 
-        return computed_hash
+    def _proof_at(self, index: int) -> List[str]:
+        """Get the merkle tree proof structure of the leaf at ``index``.
 
-    # -----------------------------------------------
-    # Static methods
-    # -----------------------------------------------
+        Args:
+            index (int): The position of the leaf, in the tree.
 
-    @staticmethod
-    def _hash_value(value: str) -> str:
+        Returns:
+            list[str]: The merkle tree proof structure
         """
-        Hash a string using sha3 algorithm.
+        read, _, _ = self._node_accessors()
+        if self.binary:
+            return [read(*i).hex() for i in self._proof_positions(index)]
+        return [read(*i) for i in self._proof_positions(index)]
+
+    def get_multi_proof(
+        self, leaves_or_indices: List[Any]
+    ) -> Tuple[List[str], List[str], List[int]]:
+        """Get a single proof for several leaves.
+
+        The siblings shared by the paths of the leaves are sent once, and a
+        sibling which is itself on a path is not sent at all. The flags
+        tell ``verify_multi_proof`` how to hash each node, level by level.
 
         Args:
-            value (str): A string to hash.
+            leaves_or_indices (list): The leaves (str) or their positions.
 
         Returns:
-            str: The value hashed
+            tuple: The leaves in tree order, the proof nodes and the flags.
+
+        Raises:
+            IndexError: No leaf at a position.
+            ValueError: A leaf is not in the merkle tree.
         """
-        return keccak.new(digest_bits=256, data=value.encode()).hexdigest()
+        count = self.count_leaves()
+        known = set()
+        for value in leaves_or_indices:
+            index = self._find_leaf(value) if isinstance(value, str) else value
+            if isinstance(value, str) and index < 0:
+                raise ValueError(f"Leaf {value} not found!")
+            if not 0 <= index < count:
+                raise IndexError(f"No leaf at index {index}!")
+            known.add(index)
 
-    @staticmethod
-    def _hash_pair(a: str, b: str) -> str:
+        sizes = self._level_sizes(count)
+        read, _, _ = self._node_accessors()
+        positions = sorted(known)
+        leaves = [read(0, i) for i in positions]
+        proof = []
+        flags: List[int] = []
+        level = 0
+        while count > 1:
+            parents = []
+            j = 0
+            while j < len(positions):
+                index = positions[j]
+                sibling = index ^ 1
+                if sibling >= count:
+                    flags.append(MULTI_PROOF_PROMOTE)
+                elif j + 1 < len(positions) and positions[j + 1] == sibling:
+                    flags.append(MULTI_PROOF_PAIR)
+                    j += 1
+                else:
+                    flags.append(MULTI_PROOF_SIBLING)
+                    proof.append(read(
+                        *self._node_position(sizes, level, sibling)
+                    ))
+                parents.append(index // 2)
+                j += 1
+            positions = parents
+            count = (count + 1) // 2
+            level += 1
+
+        if self.binary:
+            return (
+                [leaf.hex() for leaf in leaves],
+                [node.hex() for node in proof],
+                flags,
+            )
+        return leaves, proof, flags
+
+    def _proof_positions(self, index: int) -> List[Tuple[int, int]]:
+        """Get the positions of the siblings on the path of a leaf.
+
+        Args:
+            index (int): The position of the leaf.
+
+        Returns:
+            list[tuple]: The level and the index of the siblings, where
+                they are stored.
         """
-        Concatenate and hash a pair of values using sha3 algorithm.
+        count = self.count_leaves()
+        sizes = self._level_sizes(count)
+        positions: List[Tuple[int, int]] = []
+        level = 0
+        while count > 1:
+            sibling = index ^ 1
+            if sibling < count:
+                positions.append(self._node_position(sizes, level, sibling))
+            index //= 2
+            count = (count + 1) // 2
+            level += 1
+        return positions
+
+    def get_nodes(self, level: int, indexes: List[int]) -> List[str]:
+        """Get nodes of a level of the merkle tree.
+
+        A node promoted from a lower level is returned at every level it
+        goes through, so a node ``index`` of ``level`` is the root of the
+        leaves ``index * 2**level`` to ``(index + 1) * 2**level - 1``.
 
         Args:
-            a (str): The first value to hash
-            b (str): The second value to hash
+            level (int): The level, 0 for the leaves.
+            indexes (list[int]): The positions of the nodes in the level.
 
         Returns:
-            str: The values concatenated and hashed.
+            list[str]: The nodes, hex encoded in binary mode.
+
+        Raises:
+            IndexError: No node at a position.
         """
-        if all([not isinstance(a, str), not isinstance(b, str)]):
-            raise TypeError("a and b not string")
+        count = self.count_leaves()
+        sizes = self._level_sizes(count)
+        read, _, _ = self._node_accessors()
+        if not 0 <= level < len(sizes):
+            raise IndexError(f"No level {level}!")
+        width = -(-count >> level)
+        nodes = []
+        for index in indexes:
+            if not 0 <= index < width:
+                raise IndexError(f"No node at index {index}!")
+            node = read(*self._node_position(sizes, level, index))
+            nodes.append(node.hex() if self.binary else node)
+        return nodes
+
+    def diff(self, other: "MerkleTree") -> List[int]:
+        """Find the positions of the leaves differing from another tree.
+
+        See ``diff_remote``, with the nodes read from ``other``.
+
+        Args:
+            other (MerkleTree): The tree to compare to.
 
-        if a < b:
-            return keccak.new(
-                digest_bits=256, data=(a.encode() + b.encode())
-            ).hexdigest()
-        return keccak.new(
-            digest_bits=256, data=(b.encode() + a.encode())
-        ).hexdigest()
+        Returns:
+            list[int]: The sorted positions of the leaves differing.
+
+        Raises:
+            ValueError: The trees have different hash backends.
+        """
+        if other.hash_backend != self.hash_backend:
+            raise ValueError("The trees have different hash backends!")
+        return self.diff_remote(other.get_nodes, other.count_leaves())
+
+    def diff_remote(
+        self,
+        get_nodes: Callable[[int, List[int]], List[str]],
+        leaf_count: int,
+    ) -> List[int]:
+        """Find the positions of the leaves differing from a remote tree.
+
+        The trees are walked from the top, level by level, and only the
+        subtrees whose roots differ are walked further down: ``get_nodes``
+        is called once per level with the nodes to compare, so ``k``
+        differences in ``n`` leaves cost about ``k * log2(n)`` nodes. The
+        leaves after the last leaf of the shortest tree all differ.
+
+        Args:
+            get_nodes (Callable): The ``get_nodes`` of the remote tree, for
+                instance a request to the replica holding it.
+            leaf_count (int): The number of leaves of the remote tree.
+
+        Returns:
+            list[int]: The sorted positions of the leaves differing.
+        """
+        count = self.count_leaves()
+        common = min(count, leaf_count)
+        extra = list(range(common, max(count, leaf_count)))
+        if common == 0:
+            return extra
+
+        differ = []
+        level = (common - 1).bit_length()
+        indexes = [0]
+        while indexes:
+            # The nodes over the last leaves only match for equal trees
+            compared = [
+                i for i in indexes
+                if (i + 1) << level <= common or count == leaf_count
+            ]
+            same = set()
+            if compared:
+                local = self.get_nodes(level, compared)
+                remote = get_nodes(level, compared)
+                same = {
+                    i for i, a, b in zip(compared, local, remote) if a == b
+                }
+
+            children = []
+            for index in indexes:
+                if index in same:
+                    continue
+                if level == 0:
+                    differ.append(index)
+                    continue
+                children.append(2 * index)
+                if (2 * index + 1) << (level - 1) < common:
+                    children.append(2 * index + 1)
+            indexes = children
+            level -= 1
+
+        return differ + extra
+
+    def contains(self, leaf: str) -> bool:
+        """Check that a leaf is in the merkle tree.
+
+        Args:
+            leaf (str): The leaf to find.
+
+        Returns:
+            True if the leaf is in the merkle tree.
+        """
+        return self._find_leaf(leaf) >= 0
+
+    def index_of(self, leaf: str) -> int:
+        """Get the position of a leaf.
+
+        Args:
+            leaf (str): The leaf to find.
+
+        Returns:
+            int: The position of the first leaf equal to ``leaf``.
+
+        Raises:
+            ValueError: The leaf is not in the merkle tree.
+        """
+        index = self._find_leaf(leaf)
+        if index < 0:
+            raise ValueError(f"Leaf {leaf} not found!")
+        return index
+
+    def positions_of(self, leaf: str) -> List[int]:
+        """Get the positions of all the leaves equal to a leaf.
+
+        Args:
+            leaf (str): The leaf to find.
+
+        Returns:
+            list[int]: The sorted positions, empty if none.
+        """
+        if self.leaf_index:
+            return self._indexed_positions(leaf)
+        return [i for i, value in enumerate(self.get_leaves()) if value == leaf]
+
+    def _find_leaf(self, leaf: str) -> int:
+        """Find the position of a leaf.
+
+        Args:
+            leaf (str): The leaf to find.
+
+        Returns:
+            int: The position of the first leaf equal to ``leaf``, or -1.
+        """
+        if self.leaf_index:
+            positions = self._indexed_positions(leaf)
+            return positions[0] if positions else -1
+
+        leaves = self._levels[0] if self._levels else []
+        if not self.binary:
+            try:
+                return leaves.index(leaf)
+            except ValueError:
+                return -1
+
+        try:
+            raw = bytes.fromhex(leaf)
+        except ValueError:
+            return -1
+        if len(raw) != DIGEST_SIZE:
+            return -1
+
+        # The leaves of a tree file are a view of the start of its nodes
+        nodes: Any = leaves.obj if isinstance(leaves, memoryview) else leaves
+        end = len(leaves)
+        pos = nodes.find(raw, 0, end)
+        while pos > 0 and pos % DIGEST_SIZE:
+            pos = nodes.find(raw, pos + 1, end)
+        return pos // DIGEST_SIZE if pos >= 0 else -1
+
+    def _leaf_key(self, position: int) -> Any:
+        """Get the index key of the leaf at a position.
+
+        Args:
+            position (int): The position of the leaf.
+
+        Returns:
+            The leaf, or the 8-byte prefix of its digest in binary mode.
+        """
+        leaves = self._levels[0]
+        if self.binary:
+            start = position * DIGEST_SIZE
+            return int.from_bytes(leaves[start:start + 8], sys.byteorder)
+        return leaves[position]
+
+    def _build_index(self) -> None:
+        """Index the positions of all the leaves.
+
+        The index is built from the leaves once they are hashed, with the
+        loops of ``dict`` and ``sorted``: only the duplicate leaves of a hex
+        tree are gathered one by one.
+
+        Returns:
+            None
+        """
+        self._index = {}
+        self._index_keys = array("Q")
+        self._index_positions = array("Q")
+        if not self.leaf_index or not self._levels:
+            return
+
+        leaves = self._levels[0]
+        if self.binary:
+            # The first 8 bytes of each digest, as native integers
+            prefixes = memoryview(leaves).cast("B").cast("Q")
+            keys = array("Q", prefixes[::DIGEST_SIZE // 8])
+            positions = array(
+                "Q", sorted(range(len(keys)), key=keys.__getitem__)
+            )
+            self._index_keys = array("Q", map(keys.__getitem__, positions))
+            self._index_positions = positions
+            return
+
+        index: Dict[Any, Any] = dict(zip(leaves, range(len(leaves))))
+        if len(index) < len(leaves):
+            # Each leaf maps to its last position, the duplicates are
+            # gathered in order
+            for position, leaf in enumerate(leaves):
+                found = index[leaf]
+                if isinstance(found, list):
+                    found.append(position)
+                elif found != position:
+                    index[leaf] = [position]
+        self._index = index
+
+    def _index_leaves(self, positions: Iterable[int]) -> None:
+        """Add leaves to the ``_index``.
+
+        In binary mode, the ``_index`` of the leaves appended or changed is
+        merged in the sorted arrays once it holds a quarter of their keys.
+
+        Args:
+            positions (Iterable[int]): The positions of the leaves.
+
+        Returns:
+            None
+        """
+        index = self._index
+        for position in positions:
+            key = self._leaf_key(position)
+            found = index.get(key)
+            if found is None:
+                index[key] = position
+            elif isinstance(found, int):
+                if found != position:
+                    index[key] = sorted((found, position))
+            elif position not in found:
+                insort(found, position)
+        if self.binary and len(index) > 1024 + len(self._index_keys) // 4:
+            self._build_index()
+
+    def _unindex_leaves(self, positions: Iterable[int]) -> None:
+        """Remove leaves from the ``_index``.
+
+        The sorted arrays of binary mode are left as is: a position whose
+        leaf changed no longer matches the leaf looked up.
+
+        Args:
+            positions (Iterable[int]): The positions of the leaves.
+
+        Returns:
+            None
+        """
+        index = self._index
+        for position in positions:
+            key = self._leaf_key(position)
+            found = index.get(key)
+            if found is None:
+                continue
+            if isinstance(found, int):
+                if found == position:
+                    del index[key]
+                continue
+            if position in found:
+                found.remove(position)
+                if len(found) == 1:
+                    index[key] = found[0]
+
+    def _indexed_positions(self, leaf: str) -> List[int]:
+        """Get the positions of a leaf from the ``_index``.
+
+        Args:
+            leaf (str): The leaf to find.
+
+        Returns:
+            list[int]: The sorted positions of the leaves equal to ``leaf``.
+        """
+        if not self.binary:
+            found = self._index.get(leaf)
+            if found is None:
+                return []
+            return [found] if isinstance(found, int) else list(found)
+
+        try:
+            expected = bytes.fromhex(leaf)
+        except ValueError:
+            return []
+        if len(expected) != DIGEST_SIZE:
+            return []
+        key = int.from_bytes(expected[:8], sys.byteorder)
+
+        keys = self._index_keys
+        start = bisect_left(keys, key)
+        positions = list(
+            self._index_positions[start:bisect_right(keys, key, start)]
+        )
+        found = self._index.get(key)
+        if found is not None:
+            positions += [found] if isinstance(found, int) else found
+
+        # Other leaves may share the prefix, or have changed since
+        read, _, _ = self._node_accessors()
+        return sorted({i for i in positions if read(0, i) == expected})
+
+    def _get_merkle_proof(self, leaf: str, values: Optional[List[str]] = None):
+        """Get the merkle tree proof structure.
+
+        Args:
+            leaf (str): The leaf's proof to provide
+            values (list[str]): The proof values
+
+        Returns:
+            list[str]: The merkle tree proof structure
+        """
+        if values is None:
+            values = []
+
+        hash = None
+        if self._proofs.get(leaf) is not None:
+            value, hash = self._proofs[leaf]
+            values.append(value)
+
+        if hash:
+            self._get_merkle_proof(hash, values)
+
+        return values
+
+    def verify(
+        self,
+        proof: Union[Sequence[str], bytes, memoryview],
+        root_tree: str,
+        leaf: str,
+    ) -> bool:
+        """Check that a value is part of the merkle tree.
+
+        The proof is either the list of ``get_merkle_proof`` or a proof of
+        ``encode_proof``, whose siblings are hashed as raw digests.
+
+        Args:
+            proofs (list[str] | bytes): The proofs values.
+            root_tree (str): The merkle tree root.
+            leaf (str): The value to check.
+
+        Returns:
+            True if the value is part of the merkle tree.
+        """
+        observer = self.observer
+        start = perf_counter() if observer is not None else 0.0
+        try:
+            if isinstance(proof, (bytes, bytearray, memoryview)):
+                valid = self._verify_encoded(proof, leaf) == root_tree
+            else:
+                valid = self._verify(proof, leaf) == root_tree
+        except ValueError:
+            # Not hex encoded, for the backends hashing raw digests
+            valid = False
+        if observer is not None:
+            observer.on_verify(perf_counter() - start)
+        return valid
+
+    def verify_multi_proof(
+        self,
+        proof: List[str],
+        flags: List[int],
+        root_tree: str,
+        leaves: List[str],
+    ) -> bool:
+        """Check that several values are part of the merkle tree.
+
+        The nodes are hashed from a queue, starting with the leaves, so
+        every ancestor shared by the leaves is hashed once.
+
+        Args:
+            proof (list[str]): The proof nodes of ``get_multi_proof``.
+            flags (list[int]): The flags of ``get_multi_proof``.
+            root_tree (str): The merkle tree root.
+            leaves (list[str]): The values to check, in tree order.
+
+        Returns:
+            True if the values are part of the merkle tree.
+        """
+        hash_pair = self._backend.hash_hex_pair
+        queue = deque(leaves)
+        siblings = iter(proof)
+        try:
+            for flag in flags:
+                a = queue.popleft()
+                if flag == MULTI_PROOF_PROMOTE:
+                    queue.append(a)
+                elif flag == MULTI_PROOF_PAIR:
+                    queue.append(hash_pair(a, queue.popleft()))
+                else:
+                    queue.append(hash_pair(a, next(siblings)))
+        except (IndexError, StopIteration, ValueError):
+            return False
+
+        if next(siblings, None) is not None or len(queue) != 1:
+            return False
+        return queue[0] == root_tree
+
+    def verify_batch(
+        self,
+        items: Iterable[Tuple[str, Union[Sequence[str], bytes, memoryview]]],
+        root_tree: str,
+        executor: Optional[Executor] = None,
+    ) -> List[bool]:
+        """Check that many values are part of the merkle tree.
+
+        See the ``verify_batch`` function, which needs no tree.
+
+        Args:
+            items (Iterable): The (leaf, proof) pairs to check.
+            root_tree (str): The merkle tree root.
+            executor (Executor): The pool used to check chunks of items.
+
+        Returns:
+            list[bool]: True for each value part of the merkle tree.
+        """
+        return verify_batch(
+            items, root_tree, executor, hash_backend=self.hash_backend
+        )
+
+    def encode_proof(self, proof: Sequence[str]) -> bytes:
+        """Encode a proof in the compact binary format.
+
+        The siblings are packed as raw 32-byte digests after a short header
+        holding the format version, the hash backend and the depth, see
+        ``src.apps.storage``.
+
+        Args:
+            proof (list[str]): The merkle tree proof structure.
+
+        Returns:
+            bytes: The encoded proof.
+
+        Raises:
+            ValueError: A sibling is not a digest, or the hash backend has
+                no id.
+        """
+        return pack_proof(
+            self._decode_digests(list(proof)), self._backend.backend_id
+        )
+
+    def decode_proof(self, data: Union[bytes, memoryview]) -> List[str]:
+        """Decode a proof of ``encode_proof``.
+
+        Args:
+            data (bytes | memoryview): The encoded proof.
+
+        Returns:
+            list[str]: The merkle tree proof structure.
+
+        Raises:
+            ValueError: The proof is malformed or of another hash backend.
+        """
+        encoded = self._encoded_siblings(data).hex()
+        size = 2 * DIGEST_SIZE
+        return [encoded[i:i + size] for i in range(0, len(encoded), size)]
+
+    def _encoded_siblings(self, data: Union[bytes, memoryview]) -> memoryview:
+        """Get the packed raw siblings of an encoded proof.
+
+        Args:
+            data (bytes | memoryview): The encoded proof.
+
+        Returns:
+            memoryview: The siblings, from the leaf up.
+
+        Raises:
+            ValueError: The proof is malformed or of another hash backend.
+        """
+        backend_id, siblings = unpack_proof(data)
+        if backend_id != self._backend.backend_id:
+            raise ValueError(
+                f"Proof of hash backend {backend_id}, "
+                f"not {self.hash_backend!r}!"
+            )
+        return siblings
+
+    def _verify_encoded(self, proof: Union[bytes, memoryview], leaf: str):
+        """Build a merkle tree root based on an encoded proof.
+
+        Args:
+            proof (bytes | memoryview): The encoded proof.
+            leaf (str): The value to check.
+
+        Returns:
+            The merkle tree root.
+        """
+        siblings = self._encoded_siblings(proof)
+        if not siblings:
+            return leaf
+
+        hash_pair = self._backend.hash_pair
+        raw = siblings.tobytes()
+        computed_hash = self._decode_digests([leaf])
+        for i in range(0, len(raw), DIGEST_SIZE):
+            computed_hash = hash_pair(computed_hash, raw[i:i + DIGEST_SIZE])
+
+        return computed_hash.hex()
+
+    def _verify(self, proof: Sequence[str], leaf: str):
+        """Build a merkle tree root based on values provided.
+
+        Args:
+            proofs (list[str]): The proofs values.
+            leaf (str): The value to check.
+
+        Returns:
+            The merkle tree root.
+        """
+        computed_hash = leaf
+        for i in proof:
+            computed_hash = self._backend.hash_hex_pair(computed_hash, i)
+
+        return computed_hash
+
+    def _node_accessors(self) -> Tuple[
+        Callable[[int, int], Any],
+        Callable[[int, int, Any], None],
+        Callable[[Any, Any], Any],
+    ]:
+        """Get the functions to read, write and hash the nodes.
+
+        A node is read and written by level and index, where it is stored
+        (see ``_node_position``). The nodes are hex strings, or raw digests
+        in binary mode.
+
+        Returns:
+            tuple: The read, write and hash pair functions.
+        """
+        levels = self._levels
+        if not self.binary:
+
+            def read_hex(level: int, index: int) -> str:
+                return levels[level][index]
+
+            def write_hex(level: int, index: int, value: str) -> None:
+                levels[level][index] = value
+
+            return read_hex, write_hex, self._backend.hash_hex_pair
+
+        def read(level: int, index: int) -> bytes:
+            start = index * DIGEST_SIZE
+            return bytes(levels[level][start:start + DIGEST_SIZE])
+
+        def write(level: int, index: int, value: bytes) -> None:
+            start = index * DIGEST_SIZE
+            levels[level][start:start + DIGEST_SIZE] = value
+
+        return read, write, self._backend.hash_pair
+
+    def _observe_hashes(self, hashes: int) -> None:
+        """Tell the ``observer`` that pairs of nodes were hashed.
+
+        Args:
+            hashes (int): The number of pairs hashed.
+
+        Returns:
+            None
+        """
+        assert self.observer is not None
+        with_proofs = self.build_proofs and not self.binary
+        self.observer.on_hashes(
+            hashes,
+            hashes * self._backend.pair_size,
+            hashes,
+            2 * hashes if with_proofs else 0,
+        )
+
+    def _level_observer(
+        self, first_level: int
+    ) -> Optional[Callable[[int], None]]:
+        """Get the callback telling the ``observer`` about each level built.
+
+        Args:
+            first_level (int): The level built first.
+
+        Returns:
+            Callable: Called with the number of pairs hashed after each
+                level, None without observer.
+        """
+        observer = self.observer
+        if observer is None:
+            return None
+
+        levels = count(first_level)
+        started = [perf_counter()]
+
+        def on_level(hashes: int) -> None:
+            now = perf_counter()
+            observer.on_build_level(next(levels), now - started[0])
+            self._observe_hashes(hashes)
+            started[0] = perf_counter()
+
+        return on_level
+
+    # -----------------------------------------------
+    # Static methods
+    # -----------------------------------------------
+
+    @staticmethod
+    def _hash_levels(
+        level: List[str],
+        levels: List[List[str]],
+        sizes: List[int],
+        proofs: Optional[Dict[str, Tuple[str, str]]],
+        hash_pair: Callable[[str, str], str],
+        on_level: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Hash the levels of a merkle tree above ``level``.
+
+        Each level of hashes is appended to ``levels``.
+
+        Args:
+            level (list[str]): The values of the first level to hash, with
+                the odd node promoted to it.
+            levels (list): The levels of the merkle tree.
+            sizes (list[int]): The number of hashes of each level.
+            proofs (dict): The proofs structure to fill, if any.
+            hash_pair (Callable): The hash function of a pair of nodes.
+            on_level (Callable): Called with the size of each level hashed.
+
+        Returns:
+            None
+        """
+        for size in sizes:
+            hashes = [""] * size
+            pairs = iter(level)
+            for i, (a, b) in enumerate(zip(pairs, pairs)):
+                hash = hash_pair(a, b)
+
+                # Create proofs
+                if proofs is not None:
+                    proofs[a] = (b, hash)
+                    proofs[b] = (a, hash)
+                hashes[i] = hash
+
+            levels.append(hashes)
+
+            # Promote the odd value to the next level
+            if len(level) % 2:
+                hashes = hashes + [level[-1]]
+            level = hashes
+            if on_level is not None:
+                on_level(size)
+
+    @staticmethod
+    def _hash_digest_levels(
+        levels: List[Any],
+        carry: bytes,
+        sizes: List[int],
+        hash_pair: Callable[[bytes, bytes], bytes],
+        on_level: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Hash the levels of a raw merkle tree above its last level.
+
+        Each level of hashes is appended to ``levels``, in a ``bytearray``.
+
+        Args:
+            levels (list[bytearray]): The levels of the raw merkle tree.
+            carry (bytes): The odd node promoted to the last level, if any.
+            sizes (list[int]): The number of hashes of each level.
+            hash_pair (Callable): The hash function of a pair of digests.
+            on_level (Callable): Called with the size of each level hashed.
+
+        Returns:
+            None
+        """
+        nodes = levels[-1]
+        for size in sizes:
+            end = len(nodes)
+            count = end // DIGEST_SIZE + bool(carry)
+            if count % 2 == 0:
+                next_carry = b""
+            elif not carry:
+                next_carry = bytes(nodes[end - DIGEST_SIZE:end])
+            else:
+                next_carry = carry
+
+            hashes = bytearray(DIGEST_SIZE * size)
+            pos = out = 0
+            for _ in range(size):
+                a = bytes(nodes[pos:pos + DIGEST_SIZE])
+                pos += DIGEST_SIZE
+                if pos < end:
+                    b = bytes(nodes[pos:pos + DIGEST_SIZE])
+                    pos += DIGEST_SIZE
+                else:
+                    b = carry
+                hashes[out:out + DIGEST_SIZE] = hash_pair(a, b)
+                out += DIGEST_SIZE
+
+            levels.append(hashes)
+            nodes, carry = hashes, next_carry
+            if on_level is not None:
+                on_level(size)
+
+    @staticmethod
+    def _decode_digests(values: List[str]) -> bytes:
+        """Decode hex encoded digests into packed raw digests.
+
+        Args:
+            values (list[str]): The lowercase hex encoded digests.
+
+        Returns:
+            bytes: The raw digests, one after the other.
+
+        Raises:
+            ValueError: A value is not a lowercase hex encoded digest.
+        """
+        joined = "".join(values)
+        try:
+            raw = bytes.fromhex(joined)
+        except ValueError:
+            raw = b""
+        if len(joined) != 2 * DIGEST_SIZE * len(values) \
+                or len(raw) != DIGEST_SIZE * len(values) \
+                or joined.lower() != joined:
+            raise ValueError("Values must be lowercase hex encoded digests!")
+        return raw
+
+    @staticmethod
+    def _level_sizes(count: int) -> List[int]:
+        """Count the nodes stored at each level of the merkle tree.
+
+        The odd node of a level is promoted as is to the next level, so it
+        is stored only once, at the lowest level it appears.
+
+        Args:
+            count (int): The number of leaves.
+
+        Returns:
+            list[int]: The number of nodes stored at each level.
+        """
+        sizes = [count]
+        while count > 1:
+            sizes.append(count // 2)
+            count = (count + 1) // 2
+        return sizes
+
+    @staticmethod
+    def _level_offsets(sizes: List[int]) -> List[int]:
+        """Get the index of the first node of each level.
+
+        Args:
+            sizes (list[int]): The number of nodes stored at each level.
+
+        Returns:
+            list[int]: The offset of each level in the merkle tree.
+        """
+        offsets = [0]
+        for size in sizes[:-1]:
+            offsets.append(offsets[-1] + size)
+        return offsets
+
+    @staticmethod
+    def _node_position(
+        sizes: List[int], level: int, index: int
+    ) -> Tuple[int, int]:
+        """Get the position where a node of the merkle tree is stored.
+
+        A promoted node is looked up at the level it is stored.
+
+        Args:
+            sizes (list[int]): The number of nodes stored at each level.
+            level (int): The level of the node.
+            index (int): The position of the node in its level.
+
+        Returns:
+            tuple: The level and the index of the node in the level.
+        """
+        while index >= sizes[level]:
+            index = 2 * sizes[level]
+            level -= 1
+        return level, index
+
+    @staticmethod
+    def _hash_value(value: str) -> str:
+        """
+        Hash a string using sha3 algorithm.
+
+        Args:
+            value (str): A string to hash.
+
+        Returns:
+            str: The value hashed
+        """
+        return keccak.new(digest_bits=256, data=value.encode()).hexdigest()
+
+    @staticmethod
+    def _hash_pair(a: str, b: str) -> str:
+        """
+        Concatenate and hash a pair of values using sha3 algorithm.
+
+        Args:
+            a (str): The first value to hash
+            b (str): The second value to hash
+
+        Returns:
+            str: The values concatenated and hashed.
+        """
+        if all([not isinstance(a, str), not isinstance(b, str)]):
+            raise TypeError("a and b not string")
+
+        return _KECCAK.hash_hex_pair(a, b)
+
+
+def _build_subtree(
+    values: list[str], binary: bool, build_proofs: bool, hash_backend: str
+) -> tuple:
+    """Build the merkle tree of a subtree in a worker.
+
+    Defined at module level so a process pool can pickle it.
+
+    Args:
+        values (list[str]): The leaves of the subtree.
+        binary (bool): Build the raw digests tree.
+        build_proofs (bool): Build the proofs structure.
+        hash_backend (str): The name of the hash backend.
+
+    Returns:
+        tuple: The levels of the merkle tree and its proofs.
+    """
+    tree = MerkleTree(
+        binary=binary, build_proofs=build_proofs, hash_backend=hash_backend
+    )
+    tree.build_merkle_tree(values)
+    return tree._levels, tree._proofs
+
+
+def verify_batch(
+    items: Iterable[Tuple[str, Union[Sequence[str], bytes, memoryview]]],
+    root_tree: str,
+    executor: Optional[Executor] = None,
+    chunk_size: int = 4096,
+    hash_backend: str = KeccakBackend.name,
+) -> List[bool]:
+    """Check that many values are part of a merkle tree.
+
+    The leaves and proofs are decoded once, then the batch is hashed level
+    by level with the raw digests of the backend, without hex strings in
+    between. The keccak backend hashes hex encoded pairs, so its nodes are
+    kept as hex encoded bytes. A pair shared by several items at a level,
+    like two sibling leaves or the paths of close leaves once they meet,
+    is hashed once. The proofs of ``encode_proof`` are unpacked into their
+    raw siblings. With an ``executor``, chunks of ``chunk_size`` items are
+    checked by its workers.
+
+    The result of each item is the one of ``MerkleTree.verify``, and a
+    malformed item is not part of the tree, whatever the other items.
+
+    Args:
+        items (Iterable): The (leaf, proof) pairs to check.
+        root_tree (str): The merkle tree root.
+        executor (Executor): The pool used to check chunks of items.
+        chunk_size (int): The number of items checked by a worker.
+        hash_backend (str): The name of the hash backend of the tree.
+
+    Returns:
+        list[bool]: True for each value part of the merkle tree.
+    """
+    items = list(items)
+    if executor is not None and len(items) > chunk_size:
+        chunks = [
+            items[i:i + chunk_size] for i in range(0, len(items), chunk_size)
+        ]
+        results: List[bool] = []
+        parts = executor.map(
+            verify_batch,
+            chunks,
+            repeat(root_tree),
+            repeat(None),
+            repeat(chunk_size),
+            repeat(hash_backend),
+        )
+        for result in parts:
+            results.extend(result)
+        return results
+
+    backend = get_hash_backend(hash_backend)
+    digest = backend.digest
+    hex_pairs = isinstance(backend, KeccakBackend)
+    decode: Callable[[str], bytes] = (
+        str.encode if hex_pairs else bytes.fromhex
+    )
+
+    size = 2 * DIGEST_SIZE if hex_pairs else DIGEST_SIZE
+
+    nodes: List[Optional[bytes]] = []
+    proofs: List[Optional[List[bytes]]] = []
+    for leaf, proof in items:
+        node: Optional[bytes] = None
+        path: Optional[List[bytes]]
+        try:
+            if isinstance(proof, (bytes, bytearray, memoryview)):
+                # Hashed from the raw digests, like ``MerkleTree.verify``
+                backend_id, siblings = unpack_proof(proof)
+                if backend_id != backend.backend_id:
+                    raise ValueError("Proof of another hash backend!")
+                raw = siblings.tobytes()
+                if hex_pairs:
+                    raw = hexlify(raw)
+                path = [raw[i:i + size] for i in range(0, len(raw), size)]
+                if path:
+                    node = MerkleTree._decode_digests([leaf])
+                    if hex_pairs:
+                        node = hexlify(node)
+            else:
+                path = [decode(sibling) for sibling in proof]
+                if path:
+                    node = decode(leaf)
+        except (TypeError, ValueError):
+            # Not hex encoded, or not strings, so not part of the tree:
+            # a malformed item must not fail the others of the batch
+            path = None
+        nodes.append(node)
+        proofs.append(path)
+
+    depth = max((len(path) for path in proofs if path), default=0)
+    for level in range(depth):
+        hashed: Dict[bytes, bytes] = {}
+        for i, path in enumerate(proofs):
+            a = nodes[i]
+            if path is not None and level < len(path) and a is not None:
+                b = path[level]
+                pair = a + b if a < b else b + a
+                hash = hashed.get(pair)
+                if hash is None:
+                    hash = digest(pair)
+                    if hex_pairs:
+                        hash = hexlify(hash)
+                    hashed[pair] = hash
+                nodes[i] = hash
+
+    # The root is compared as a string, like ``verify``, and a leaf
+    # without proof is its own root
+    return [
+        path is not None and (
+            leaf == root_tree if not path else node is not None and (
+                node.decode() if hex_pairs else node.hex()
+            ) == root_tree
+        )
+        for (leaf, _), path, node in zip(items, proofs, nodes)
+    ]
+
+
+class MerkleTreeBuilder:
+    """
+    Build a merkle tree from a stream of leaves, with bounded memory.
+
+    The builder keeps the frontier of the tree: the roots of the complete
+    subtrees of 2^k leaves on its right edge, at most one per level, like
+    the bits of a binary counter. A new leaf is hashed with the frontier
+    as long as it completes a subtree. Once all leaves are added, the
+    frontier is hashed from the smallest subtree up, which is the odd
+    node promotion of ``build_merkle_tree``.
+
+    With a ``path``, the nodes of each level are also spilled to a
+    temporary file as they are hashed, and written as a tree file (see
+    ``MerkleTree.open``) by ``get_root_tree``.
+    """
+
+    def __init__(
+        self, hash_backend: str = KeccakBackend.name, path: Optional[str] = None
+    ):
+        self.hash_backend = hash_backend
+        self.path = path
+        self._hash_pair = get_hash_backend(hash_backend).hash_hex_pair
+        self._frontier: List[Optional[str]] = []
+        self._levels: List[IO[bytes]] = []
+        self._count = 0
+
+    def count_leaves(self) -> int:
+        """Count the number of leaves added.
+
+        Returns:
+            int: The number of leaves.
+        """
+        return self._count
+
+    def add_leaf(self, value: str) -> None:
+        """Add a leaf to the merkle tree.
+
+        Args:
+            value (str): The leaf to add.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The value is not a digest (with ``path``).
+        """
+        self.add_leaves([value])
+
+    def add_leaves(self, values: Iterable[str]) -> None:
+        """Add leaves to the merkle tree.
+
+        Args:
+            values (Iterable[str]): The leaves to add.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: A value is not a digest (with ``path``).
+        """
+        frontier = self._frontier
+        hash_pair = self._hash_pair
+        spill = self._spill if self.path else None
+        for node in values:
+            if spill:
+                spill(0, node)
+            level = 0
+            # An empty string is a leaf, only None is an empty slot
+            while level < len(frontier) and (
+                left := frontier[level]
+            ) is not None:
+                node = hash_pair(left, node)
+                frontier[level] = None
+                level += 1
+                if spill:
+                    spill(level, node)
+            if level == len(frontier):
+                frontier.append(node)
+            else:
+                frontier[level] = node
+            self._count += 1
+
+    def get_root_tree(self) -> str:
+        """Get the root of the merkle tree.
+
+        With a ``path``, the tree file is written and the builder can no
+        longer be used.
+
+        Returns:
+            str: The merkle tree root.
+
+        Raises:
+            IndexError: No leaf added.
+        """
+        root: Optional[str] = None
+        for level, node in enumerate(self._frontier):
+            if node is None:
+                continue
+            if root is None:
+                root = node
+            else:
+                root = self._hash_pair(node, root)
+                if self.path:
+                    self._spill(level + 1, root)
+
+        if root is None:
+            raise IndexError("No merkle tree found!")
+        if self.path:
+            self._write_tree_file()
+        return root
+
+    def _spill(self, level: int, node: str) -> None:
+        """Append a node to the temporary file of its level.
+
+        Args:
+            level (int): The level of the node.
+            node (str): The hex encoded node.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The node is not a hex encoded digest.
+        """
+        if level == len(self._levels):
+            self._levels.append(TemporaryFile())
+        self._levels[level].write(MerkleTree._decode_digests([node]))
+
+    def _write_tree_file(self) -> None:
+        """Write the tree file from the temporary files of the levels.
+
+        Returns:
+            None
+        """
+        assert self.path is not None
+        sizes = MerkleTree._level_sizes(self._count)
+        levels = [level for level in self._levels if level.tell()]
+
+        def chunks() -> Iterator[bytes]:
+            for level in levels:
+                level.seek(0)
+                while chunk := level.read(2 ** 20):
+                    yield chunk
+                level.close()
+
+        write_tree_file(
+            self.path,
+            chunks(),
+            self._count,
+            MerkleTree._level_offsets(sizes),
+            self.hash_backend,
+        )
+        self._levels = []
+
+
+# Default node of every empty subtree height, by hash backend
+_SPARSE_DEFAULTS: Dict[str, List[bytes]] = {}
+
+
+@dataclass(slots=True)
+class SparseMerkleTree:
+    """
+    Class to build a sparse Merkle Tree over a 256-bit key space.
+
+    It allows
+        - to set and delete the value of a key
+        - to prove that a key has a value, or that it has none
+        - to verify these proofs
+
+    A key and its value are 32-byte digests, hex encoded. The leaf of a
+    key is its hashed pair (key, value), and the leaf of an empty key is
+    32 zero bytes, so the node of an empty subtree only depends on its
+    height: the ``DEPTH + 1`` default nodes are computed once. Only the
+    nodes differing from the defaults are stored, ``DEPTH`` per key at
+    most.
+
+    The nodes are hashed as in ``MerkleTree``, by the ``hash_backend``,
+    but in their order (left, right): the sorted pairs of a dense tree
+    would let a proof of an empty key prove any other key.
+
+    The proofs are compressed: a bitmap of the heights whose sibling is
+    not a default node, and these siblings only, from the leaf up.
+    """
+
+    DEPTH = 256
+
+    hash_backend: str = KeccakBackend.name
+    # The nodes by heap index: 1 is the root, 2**DEPTH + key a leaf
+    _nodes: Dict[int, bytes] = field(default_factory=dict, repr=False)
+    _values: Dict[int, str] = field(default_factory=dict, repr=False)
+    _backend: HashBackend = field(init=False, repr=False, compare=False)
+    _defaults: List[bytes] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._backend = get_hash_backend(self.hash_backend)
+        self._defaults = self._default_nodes(self._backend)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def count_leaves(self) -> int:
+        """Count the keys with a value.
+
+        Returns:
+            int: The number of keys with a value.
+        """
+        return len(self._values)
+
+    def get_root_tree(self) -> str:
+        """Get the root of the sparse merkle tree.
+
+        Returns:
+            str: The merkle tree root, the default root if empty.
+        """
+        return self._nodes.get(1, self._defaults[self.DEPTH]).hex()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the value of a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            str: The value, None if the key has none.
+
+        Raises:
+            ValueError: The key is not a digest.
+        """
+        return self._values.get(self._decode_key(key))
+
+    def set(self, key: str, value: str) -> None:
+        """Set the value of a key.
+
+        Args:
+            key (str): The key.
+            value (str): The value.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: The key or the value is not a digest.
+        """
+        index = self._decode_key(key)
+        leaf = self._backend.hash_ordered_pair(
+            index.to_bytes(DIGEST_SIZE, "big"),
+            MerkleTree._decode_digests([value]),
+        )
+        self._values[index] = value
+        self._update(index, leaf)
+
+    def delete(self, key: str) -> None:
+        """Remove the value of a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            None
+
+        Raises:
+            KeyError: The key has no value.
+            ValueError: The key is not a digest.
+        """
+        index = self._decode_key(key)
+        if index not in self._values:
+            raise KeyError(key)
+        del self._values[index]
+        self._update(index, self._defaults[0])
+
+    def get_proof(self, key: str) -> Tuple[int, List[str]]:
+        """Get the proof of the value of a key, or of its absence.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            tuple: The bitmap of the siblings not default, and these
+                siblings from the leaf up.
+
+        Raises:
+            ValueError: The key is not a digest.
+        """
+        nodes = self._nodes
+        node = (1 << self.DEPTH) + self._decode_key(key)
+        bitmap = 0
+        siblings = []
+        for height in range(self.DEPTH):
+            sibling = nodes.get(node ^ 1)
+            if sibling is not None:
+                bitmap |= 1 << height
+                siblings.append(sibling.hex())
+            node >>= 1
+        return bitmap, siblings
+
+    def verify(
+        self,
+        proof: Tuple[int, List[str]],
+        root_tree: str,
+        key: str,
+        value: str,
+    ) -> bool:
+        """Check that a key has a value in the sparse merkle tree.
+
+        Args:
+            proof (tuple): The proof of ``get_proof``.
+            root_tree (str): The merkle tree root.
+            key (str): The key.
+            value (str): The value.
+
+        Returns:
+            True if ``key`` has ``value``.
+        """
+        try:
+            index = self._decode_key(key)
+            leaf = self._backend.hash_ordered_pair(
+                index.to_bytes(DIGEST_SIZE, "big"),
+                MerkleTree._decode_digests([value]),
+            )
+        except ValueError:
+            return False
+        return self._verify(proof, index, leaf) == root_tree
+
+    def verify_non_inclusion(
+        self, proof: Tuple[int, List[str]], root_tree: str, key: str
+    ) -> bool:
+        """Check that a key has no value in the sparse merkle tree.
+
+        Args:
+            proof (tuple): The proof of ``get_proof``.
+            root_tree (str): The merkle tree root.
+            key (str): The key.
+
+        Returns:
+            True if ``key`` has no value.
+        """
+        try:
+            index = self._decode_key(key)
+        except ValueError:
+            return False
+        return self._verify(proof, index, self._defaults[0]) == root_tree
+
+    def _verify(
+        self, proof: Tuple[int, List[str]], index: int, leaf: bytes
+    ) -> Optional[str]:
+        """Build the root of a leaf and its proof.
+
+        Args:
+            proof (tuple): The proof of ``get_proof``.
+            index (int): The key of the leaf.
+            leaf (bytes): The leaf.
+
+        Returns:
+            str: The merkle tree root, None if the proof is malformed.
+        """
+        bitmap, siblings = proof
+        if bitmap >> self.DEPTH or bin(bitmap).count("1") != len(siblings):
+            return None
+
+        hash_pair = self._backend.hash_ordered_pair
+        defaults = self._defaults
+        node = leaf
+        position = 0
+        try:
+            for height in range(self.DEPTH):
+                if bitmap >> height & 1:
+                    sibling = bytes.fromhex(siblings[position])
+                    position += 1
+                else:
+                    sibling = defaults[height]
+                if index >> height & 1:
+                    node = hash_pair(sibling, node)
+                else:
+                    node = hash_pair(node, sibling)
+        except ValueError:
+            return None
+        return node.hex()
+
+    def _update(self, index: int, leaf: bytes) -> None:
+        """Write a leaf and hash again its ancestors.
+
+        The nodes equal to their default are removed.
+
+        Args:
+            index (int): The key of the leaf.
+            leaf (bytes): The new leaf.
+
+        Returns:
+            None
+        """
+        nodes = self._nodes
+        defaults = self._defaults
+        hash_pair = self._backend.hash_ordered_pair
+        node = (1 << self.DEPTH) + index
+        hash = leaf
+        for height in range(self.DEPTH + 1):
+            if hash == defaults[height]:
+                nodes.pop(node, None)
+            else:
+                nodes[node] = hash
+            if height == self.DEPTH:
+                break
+            sibling = nodes.get(node ^ 1, defaults[height])
+            if node & 1:
+                hash = hash_pair(sibling, hash)
+            else:
+                hash = hash_pair(hash, sibling)
+            node >>= 1
+
+    @staticmethod
+    def _decode_key(key: str) -> int:
+        """Decode a hex encoded key.
+
+        Args:
+            key (str): The key, a hex encoded 32-byte digest.
+
+        Returns:
+            int: The key.
+
+        Raises:
+            ValueError: The key is not a lowercase hex encoded digest.
+        """
+        return int.from_bytes(MerkleTree._decode_digests([key]), "big")
+
+    @staticmethod
+    def _default_nodes(backend: HashBackend) -> List[bytes]:
+        """Get the node of an empty subtree of each height.
+
+        Args:
+            backend (HashBackend): The hash backend of the nodes.
+
+        Returns:
+            list[bytes]: The ``DEPTH + 1`` default nodes, from the leaf up.
+        """
+        defaults = _SPARSE_DEFAULTS.get(backend.name)
+        if defaults is None:
+            defaults = [bytes(DIGEST_SIZE)]
+            for _ in range(SparseMerkleTree.DEPTH):
+                defaults.append(
+                    backend.hash_ordered_pair(defaults[-1], defaults[-1])
+                )
+            _SPARSE_DEFAULTS[backend.name] = defaults
+        return defaults
@@ -0,0 +1,354 @@
+"""
+On-disk format of the merkle trees and wire format of their proofs.
+
+A file is a header of ``HEADER_SIZE`` bytes followed by the packed 32-byte
+nodes of the tree, level after level, as in the binary mode of MerkleTree.
+The header holds, little endian:
+
+    - the magic ``MRKT`` and the format version (1 byte)
+    - the name of the hash backend (16 bytes, NUL padded)
+    - the number of leaves (8 bytes) and the depth (4 bytes)
+    - the index of the first node of each level (8 bytes per level)
+
+The nodes start on a page boundary, so they can be mapped in memory as is.
+
+An encoded proof is the proof version (1 byte), the id of the hash backend
+(1 byte), the number of siblings as an unsigned LEB128 varint and the packed
+32-byte siblings, from the leaf up.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import mmap as mmap_module
+import struct
+from bisect import bisect_right
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple, Union, overload
+
+from src.apps.hashing import DIGEST_SIZE
+
+MAGIC = b"MRKT"
+VERSION = 1
+HEADER_SIZE = 4096
+PROOF_VERSION = 1
+
+_HEADER = struct.Struct("<4sBx16sQI")
+_OFFSET = struct.Struct("<Q")
+
+Nodes = Union[bytearray, mmap_module.mmap]
+
+
+class _SegmentsView(Sequence[str]):
+    """
+    A read-only sequence of nodes split in segments, one after the other.
+
+    A node is read from its segment, found by a binary search over the
+    index of the first node of each segment, so a view of a tree costs
+    ``O(depth)`` to create and nothing is copied.
+    """
+
+    __slots__ = ("_segments", "_starts")
+
+    def __init__(self, segments: List[Any], sizes: Iterable[int]):
+        """
+        Args:
+            segments (list): The segments of nodes.
+            sizes (Iterable[int]): The number of nodes of each segment.
+        """
+        starts = [0]
+        for size in sizes:
+            starts.append(starts[-1] + size)
+        self._segments = segments
+        self._starts = starts
+
+    def _node(self, segment: Any, index: int) -> str:
+        """Read the node at ``index`` of a segment."""
+        raise NotImplementedError
+
+    def _iter_segment(self, segment: Any, size: int) -> Iterator[str]:
+        """Read the ``size`` first nodes of a segment."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError(f"{type(self).__name__} index out of range")
+        segment = bisect_right(self._starts, index) - 1
+        return self._node(
+            self._segments[segment], index - self._starts[segment]
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        starts = self._starts
+        for i, segment in enumerate(self._segments):
+            yield from self._iter_segment(segment, starts[i + 1] - starts[i])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (_SegmentsView, list, tuple)):
+            return len(other) == len(self) and all(
+                a == b for a, b in zip(self, other)
+            )
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self)} nodes)"
+
+
+class NodesView(_SegmentsView):
+    """
+    A read-only sequence of hex encoded nodes over packed 32-byte nodes.
+
+    The nodes are not copied: each one is hex encoded when it is read, and
+    the view shows the changes of the nodes in place (``update_leaf``). The
+    nodes are one buffer, or one buffer per level with ``of_levels``.
+    """
+
+    __slots__ = ()
+
+    def __init__(
+        self,
+        nodes: Union[Nodes, bytes, memoryview],
+        start: int = 0,
+        stop: int = -1,
+    ):
+        """
+        Args:
+            nodes (Nodes): The packed nodes.
+            start (int): The index of the first node.
+            stop (int): The index after the last node, all the nodes if -1.
+        """
+        if stop < 0:
+            stop = len(nodes) // DIGEST_SIZE
+        view = memoryview(nodes)[start * DIGEST_SIZE:stop * DIGEST_SIZE]
+        super().__init__([view.toreadonly()], [len(view) // DIGEST_SIZE])
+
+    @classmethod
+    def of_levels(
+        cls, levels: Sequence[Union[Nodes, bytes, memoryview]]
+    ) -> "NodesView":
+        """Get a view of the packed nodes of several levels.
+
+        Args:
+            levels (list): The packed nodes of each level.
+
+        Returns:
+            NodesView: The nodes of the levels, one level after the other.
+        """
+        view = cls.__new__(cls)
+        views = [memoryview(level).toreadonly() for level in levels]
+        _SegmentsView.__init__(
+            view, views, [len(level) // DIGEST_SIZE for level in views]
+        )
+        return view
+
+    def _node(self, segment: memoryview, index: int) -> str:
+        start = index * DIGEST_SIZE
+        return segment[start:start + DIGEST_SIZE].hex()
+
+    def _iter_segment(self, segment: memoryview, size: int) -> Iterator[str]:
+        for start in range(0, size * DIGEST_SIZE, DIGEST_SIZE):
+            yield segment[start:start + DIGEST_SIZE].hex()
+
+    def tobytes(self) -> bytes:
+        """Copy the packed nodes.
+
+        Returns:
+            bytes: The raw 32-byte nodes.
+        """
+        return b"".join(segment.tobytes() for segment in self._segments)
+
+
+class LevelsView(_SegmentsView):
+    """
+    A read-only sequence of the hex encoded nodes of several levels.
+
+    The levels are not copied, so the view shows the changes of the nodes
+    in place (``update_leaf``), but not the nodes appended after it was
+    created.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, levels: Sequence[Sequence[str]]):
+        """
+        Args:
+            levels (list): The nodes of each level.
+        """
+        super().__init__(list(levels), [len(level) for level in levels])
+
+    def _node(self, segment: Sequence[str], index: int) -> str:
+        return segment[index]
+
+    def _iter_segment(
+        self, segment: Sequence[str], size: int
+    ) -> Iterator[str]:
+        return islice(segment, size)
+
+
+def write_tree_file(
+    path: str,
+    nodes: Iterable[bytes],
+    leaf_count: int,
+    offsets: List[int],
+    hash_backend: str,
+) -> None:
+    """Write a merkle tree file.
+
+    Args:
+        path (str): The path of the file.
+        nodes (Iterable[bytes]): The packed raw nodes of the tree, in chunks.
+        leaf_count (int): The number of leaves.
+        offsets (list[int]): The index of the first node of each level.
+        hash_backend (str): The name of the hash backend.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: The backend name or the depth does not fit the header.
+    """
+    name = hash_backend.encode()
+    if len(name) > 16:
+        raise ValueError(f"Hash backend name {hash_backend!r} too long!")
+
+    header = _HEADER.pack(MAGIC, VERSION, name, leaf_count, len(offsets))
+    header += b"".join(_OFFSET.pack(offset) for offset in offsets)
+    if len(header) > HEADER_SIZE:
+        raise ValueError("Merkle tree too deep!")
+
+    with open(path, "wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        for chunk in nodes:
+            file.write(chunk)
+
+
+def read_tree_file(
+    path: str, mmap: bool = True
+) -> Tuple[Nodes, int, List[int], str]:
+    """Read a merkle tree file.
+
+    With ``mmap`` the nodes are mapped copy-on-write: nothing is read until
+    a node is accessed, and changes to the nodes never reach the file.
+
+    Args:
+        path (str): The path of the file.
+        mmap (bool): Map the nodes in memory instead of reading them.
+
+    Returns:
+        tuple: The nodes, the number of leaves, the index of the first node
+            of each level and the name of the hash backend.
+
+    Raises:
+        ValueError: The file is not a merkle tree file of this version.
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} is not a merkle tree file!")
+        magic, version, name, leaf_count, depth = _HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a merkle tree file!")
+        if version != VERSION:
+            raise ValueError(f"Unsupported merkle tree file version {version}!")
+        if depth > (HEADER_SIZE - _HEADER.size) // _OFFSET.size:
+            raise ValueError(f"{path} is corrupted!")
+
+        offsets = [
+            _OFFSET.unpack_from(header, _HEADER.size + _OFFSET.size * level)[0]
+            for level in range(depth)
+        ]
+        size = file.seek(0, 2) - HEADER_SIZE
+        if not offsets or size <= offsets[-1] * DIGEST_SIZE \
+                or size % DIGEST_SIZE:
+            raise ValueError(f"{path} is truncated!")
+
+        nodes: Nodes
+        if mmap and HEADER_SIZE % mmap_module.ALLOCATIONGRANULARITY == 0:
+            nodes = mmap_module.mmap(
+                file.fileno(),
+                size,
+                access=mmap_module.ACCESS_COPY,
+                offset=HEADER_SIZE,
+            )
+        else:
+            file.seek(HEADER_SIZE)
+            nodes = bytearray(file.read())
+
+    return nodes, leaf_count, offsets, name.rstrip(b"\0").decode()
+
+
+def pack_proof(siblings: bytes, backend_id: int) -> bytes:
+    """Encode a proof.
+
+    Args:
+        siblings (bytes): The packed raw siblings, from the leaf up.
+        backend_id (int): The id of the hash backend.
+
+    Returns:
+        bytes: The encoded proof.
+
+    Raises:
+        ValueError: The backend has no id or the siblings are not digests.
+    """
+    if not 0 < backend_id <= 255:
+        raise ValueError(f"Invalid hash backend id {backend_id}!")
+    depth, rest = divmod(len(siblings), DIGEST_SIZE)
+    if rest:
+        raise ValueError("Proof siblings must be 32-byte digests!")
+
+    header = bytearray((PROOF_VERSION, backend_id))
+    while depth > 0x7F:
+        header.append(depth & 0x7F | 0x80)
+        depth >>= 7
+    header.append(depth)
+    return bytes(header) + siblings
+
+
+def unpack_proof(data: Union[bytes, memoryview]) -> Tuple[int, memoryview]:
+    """Decode a proof, without copying its siblings.
+
+    Args:
+        data (bytes | memoryview): The encoded proof.
+
+    Returns:
+        tuple: The id of the hash backend and the packed raw siblings.
+
+    Raises:
+        ValueError: The proof is malformed or of another version.
+    """
+    view = memoryview(data).cast("B")
+    if len(view) < 3:
+        raise ValueError("Truncated proof!")
+    if view[0] != PROOF_VERSION:
+        raise ValueError(f"Unsupported proof version {view[0]}!")
+
+    depth = shift = 0
+    position = 2
+    while True:
+        if position == len(view) or shift > 63:
+            raise ValueError("Malformed proof depth!")
+        byte = view[position]
+        depth |= (byte & 0x7F) << shift
+        shift += 7
+        position += 1
+        if not byte & 0x80:
+            break
+
+    if len(view) - position != depth * DIGEST_SIZE:
+        raise ValueError("Proof length does not match its depth!")
+    return view[1], view[position:]
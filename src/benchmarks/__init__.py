@@ -0,0 +1,11 @@
+"""
+Benchmark suite of the Merkle Tree application.
+
+Run it with the ``merkle-benchmark`` command or ``python -m src.benchmarks``:
+
+    merkle-benchmark run --leaves 1000,1000000 --output results.json
+    merkle-benchmark compare baseline.json results.json
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
@@ -0,0 +1,12 @@
+"""
+Run the benchmark suite, see ``src.benchmarks.cli``.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import sys
+
+from src.benchmarks.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Command line of the benchmark suite.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from src.benchmarks.compare import compare
+from src.benchmarks.suite import DEFAULT_LEAVES, MODES, run
+
+
+def _integers(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def _modes(value: str) -> List[str]:
+    modes = value.split(",")
+    for mode in modes:
+        if mode not in MODES:
+            raise argparse.ArgumentTypeError(f"unknown mode {mode!r}")
+    return modes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run or compare the benchmarks.
+
+    Args:
+        argv (list[str]): The arguments, ``sys.argv`` if None.
+
+    Returns:
+        int: The exit code, 1 if ``compare`` found regressions.
+    """
+    parser = argparse.ArgumentParser(
+        prog="merkle-benchmark",
+        description="Benchmarks of the merkle tree hot paths.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--leaves",
+        type=_integers,
+        default=DEFAULT_LEAVES,
+        help="the numbers of leaves, comma separated",
+    )
+    run_parser.add_argument(
+        "--modes",
+        type=_modes,
+        default=list(MODES),
+        help="the tree modes, comma separated",
+    )
+    run_parser.add_argument(
+        "--lookups", type=int, default=1000, help="the proofs per case"
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument(
+        "--no-isolate",
+        dest="isolate",
+        action="store_false",
+        help="run the cases in this process",
+    )
+    run_parser.add_argument(
+        "--output", "-o", help="the JSON file of the results, stdout if unset"
+    )
+
+    compare_parser = commands.add_parser(
+        "compare", help="find the regressions between two results"
+    )
+    compare_parser.add_argument("baseline", help="the reference results")
+    compare_parser.add_argument("current", help="the results to check")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the relative change tolerated (default 0.1)",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.leaves, args.modes, args.lookups, args.seed, args.isolate)
+        content = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as file:
+                file.write(content + "\n")
+        else:
+            print(content)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
@@ -0,0 +1,72 @@
+"""
+Compare two results of the benchmark suite.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+# The metrics where a higher value is better, lower is better for the others
+HIGHER_IS_BETTER_SUFFIX = "_per_s"
+
+
+@dataclass(frozen=True)
+class Regression:
+    """A metric of a case worse than in the baseline."""
+
+    leaves: int
+    mode: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        """The relative change of the metric, negative when slower."""
+        return (self.current - self.baseline) / self.baseline
+
+    def __str__(self) -> str:
+        return (
+            f"{self.leaves} leaves {self.mode}: {self.metric} "
+            f"{self.baseline:,.2f} -> {self.current:,.2f} "
+            f"({self.change:+.1%})"
+        )
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1
+) -> List[Regression]:
+    """Find the metrics worse than the baseline by more than ``threshold``.
+
+    Only the cases and metrics of both results are compared.
+
+    Args:
+        baseline (dict): The results of the reference run.
+        current (dict): The results to check.
+        threshold (float): The relative change tolerated, 0.1 for 10%.
+
+    Returns:
+        list[Regression]: The regressions found.
+    """
+    def cases(report: Dict[str, Any]) -> Dict[Tuple[int, str], Dict[str, Any]]:
+        return {
+            (result["leaves"], result["mode"]): result
+            for result in report["results"]
+        }
+
+    reference = cases(baseline)
+    regressions = []
+    for key, result in cases(current).items():
+        if key not in reference:
+            continue
+        for metric, value in result.items():
+            base = reference[key].get(metric)
+            if metric in ("leaves", "mode") or not base:
+                continue
+            change = (value - base) / base
+            if metric.endswith(HIGHER_IS_BETTER_SUFFIX):
+                change = -change
+            if change > threshold:
+                regressions.append(Regression(*key, metric, base, value))
+    return regressions
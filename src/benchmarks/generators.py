@@ -0,0 +1,55 @@
+"""
+Deterministic synthetic leaves of the benchmarks.
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import hashlib
+import random
+from typing import Iterator, List
+
+
+def iter_leaves(count: int, seed: int = 0) -> Iterator[str]:
+    """Generate hex encoded 32-byte leaves.
+
+    The same ``count`` and ``seed`` always give the same leaves, on every
+    platform.
+
+    Args:
+        count (int): The number of leaves.
+        seed (int): The seed of the leaves.
+
+    Returns:
+        Iterator[str]: The leaves.
+    """
+    prefix = seed.to_bytes(8, "big")
+    for i in range(count):
+        yield hashlib.sha256(prefix + i.to_bytes(8, "big")).hexdigest()
+
+
+def make_leaves(count: int, seed: int = 0) -> List[str]:
+    """Generate a list of hex encoded 32-byte leaves, see ``iter_leaves``.
+
+    Args:
+        count (int): The number of leaves.
+        seed (int): The seed of the leaves.
+
+    Returns:
+        list[str]: The leaves.
+    """
+    return list(iter_leaves(count, seed))
+
+
+def sample_indexes(count: int, size: int, seed: int = 0) -> List[int]:
+    """Pick the positions of the leaves looked up by the benchmarks.
+
+    Args:
+        count (int): The number of leaves.
+        size (int): The number of positions.
+        seed (int): The seed of the positions.
+
+    Returns:
+        list[int]: ``size`` positions, with repeats if more than ``count``.
+    """
+    rng = random.Random(seed)
+    return [rng.randrange(count) for _ in range(size)]
@@ -0,0 +1,189 @@
+"""
+Benchmarks of the build, proof and verify hot paths.
+
+A case builds a tree of a number of leaves in a mode (``hex`` or
+``binary``) and measures:
+
+    - ``build_leaves_per_s``: the leaves built per second
+    - ``build_hashes_per_s``: the pairs hashed per second by the build
+    - ``build_hashes_per_leaf``: the pairs hashed by the build per leaf,
+      about 1 (``n - 1`` pairs for ``n`` leaves) unless pairs are hashed
+      more than once
+    - ``proofs_per_s`` / ``proofs_at_per_s``: the proofs per second, by
+      leaf (``get_merkle_proof``) and by position (``get_merkle_proof_at``)
+    - ``verifies_per_s`` / ``batch_verifies_per_s``: the proofs checked per
+      second by ``verify`` and ``verify_batch``
+    - ``peak_rss_mb``: the peak resident memory of the process, with the
+      tree built and looked up
+
+Author:
+Arnaud SENE, arnaud.sene@pm.me
+"""
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from src.apps.hashing import HashBackend, KeccakBackend
+from src.apps.merkle import MerkleTree, verify_batch
+from src.benchmarks.generators import make_leaves, sample_indexes
+
+DEFAULT_LEAVES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+MODES = ("hex", "binary")
+
+Result = Dict[str, Any]
+
+
+class _CountingBackend(HashBackend):
+    """A hash backend counting the pairs hashed by another one."""
+
+    def __init__(self, backend: HashBackend):
+        self.backend = backend
+        self.name = backend.name
+        self.calls = 0
+
+    def digest(self, data: bytes) -> bytes:
+        return self.backend.digest(data)
+
+    def hash_pair(self, a: bytes, b: bytes) -> bytes:
+        self.calls += 1
+        return self.backend.hash_pair(a, b)
+
+    def hash_hex_pair(self, a: str, b: str) -> str:
+        self.calls += 1
+        return self.backend.hash_hex_pair(a, b)
+
+
+def _rate(count: int, func: Callable[[], Any]) -> float:
+    """Run ``func`` and get the number of operations per second.
+
+    Args:
+        count (int): The number of operations done by ``func``.
+        func (Callable): The operations to time.
+
+    Returns:
+        float: The operations per second.
+    """
+    start = time.perf_counter()
+    func()
+    return count / max(time.perf_counter() - start, 1e-9)
+
+
+def _peak_rss_mb() -> float:
+    """Get the peak resident memory of the process.
+
+    Returns:
+        float: The peak resident memory in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def run_case(count: int, mode: str, lookups: int = 1000, seed: int = 0) -> Result:
+    """Benchmark a tree of ``count`` leaves.
+
+    Args:
+        count (int): The number of leaves.
+        mode (str): ``hex`` or ``binary``.
+        lookups (int): The number of proofs built and checked.
+        seed (int): The seed of the leaves and of the lookups.
+
+    Returns:
+        dict: The number of leaves, the mode and the metrics.
+
+    Raises:
+        ValueError: Unknown mode.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}!")
+    binary = mode == "binary"
+    leaves = make_leaves(count, seed)
+
+    mt = MerkleTree(binary=binary)
+    build = _rate(count, lambda: mt.build_merkle_tree(leaves))
+
+    indexes = sample_indexes(count, lookups, seed)
+    sample = [leaves[i] for i in indexes]
+    proofs_by_leaf = _rate(
+        lookups, lambda: [mt.get_merkle_proof(leaf) for leaf in sample]
+    )
+    proofs = [mt.get_merkle_proof_at(i) for i in indexes]
+    proofs_at = _rate(
+        lookups, lambda: [mt.get_merkle_proof_at(i) for i in indexes]
+    )
+
+    root = mt.get_root_tree()
+    items = list(zip(sample, proofs))
+    verifies = _rate(
+        lookups, lambda: [mt.verify(p, root, leaf) for leaf, p in items]
+    )
+    batch_verifies = _rate(lookups, lambda: verify_batch(items, root))
+    # Before the tree counting the hashes is built
+    peak_rss = _peak_rss_mb()
+
+    counted = MerkleTree(binary=binary)
+    counter = _CountingBackend(KeccakBackend())
+    counted._backend = counter
+    counted.build_merkle_tree(leaves)
+
+    return {
+        "leaves": count,
+        "mode": mode,
+        "build_leaves_per_s": build,
+        "build_hashes_per_s": counter.calls * build / count,
+        "build_hashes_per_leaf": counter.calls / count,
+        "proofs_per_s": proofs_by_leaf,
+        "proofs_at_per_s": proofs_at,
+        "verifies_per_s": verifies,
+        "batch_verifies_per_s": batch_verifies,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def run(
+    leaves: List[int],
+    modes: List[str],
+    lookups: int = 1000,
+    seed: int = 0,
+    isolate: bool = True,
+) -> Dict[str, Any]:
+    """Run the benchmark cases.
+
+    Args:
+        leaves (list[int]): The numbers of leaves of the cases.
+        modes (list[str]): The modes of the cases.
+        lookups (int): The number of proofs built and checked per case.
+        seed (int): The seed of the leaves and of the lookups.
+        isolate (bool): Run every case in a new process, so the peak
+            memory is the one of the case.
+
+    Returns:
+        dict: The environment (``meta``) and the results of the cases.
+    """
+    results = []
+    for count in leaves:
+        for mode in modes:
+            if not isolate:
+                results.append(run_case(count, mode, lookups, seed))
+                continue
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                results.append(
+                    executor.submit(run_case, count, mode, lookups, seed).result()
+                )
+
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "lookups": lookups,
+            "seed": seed,
+        },
+        "results": results,
+    }
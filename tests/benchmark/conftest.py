@@ -0,0 +1,33 @@
+"""
+Shared settings for the benchmarks.
+
+The benchmarks are slow, they only run when ``MERKLE_BENCHMARK`` is set:
+
+    MERKLE_BENCHMARK=1 python -m pytest -v -s tests/benchmark/
+
+``MERKLE_BENCHMARK_LEAVES`` sets the number of leaves (default 1,000,000).
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import os
+
+import pytest
+
+from src.benchmarks.generators import make_leaves
+
+LEAVES = int(os.environ.get("MERKLE_BENCHMARK_LEAVES", 1_000_000))
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("MERKLE_BENCHMARK"):
+        return
+    skip = pytest.mark.skip(reason="set MERKLE_BENCHMARK=1 to run")
+    for item in items:
+        if "tests/benchmark" in str(item.fspath):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def leaves() -> list[str]:
+    return make_leaves(LEAVES)
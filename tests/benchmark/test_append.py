@@ -0,0 +1,45 @@
+"""
+Benchmark of the appends of leaves, one at a time.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import sys
+import time
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+from src.benchmarks.generators import make_leaves
+
+APPENDS = 1_000
+
+
+@pytest.mark.parametrize("options", [
+    {}, {"binary": True}, {"build_proofs": False}
+])
+def test_append_leaf_latency(leaves, options):
+    extra = make_leaves(APPENDS, seed=1)
+    mt = MerkleTree(**options)
+    mt.build_merkle_tree(leaves)
+
+    start = time.perf_counter()
+    for leaf in extra:
+        mt.append_leaf(leaf)
+    append = (time.perf_counter() - start) / APPENDS
+
+    start = time.perf_counter()
+    for index, leaf in enumerate(extra):
+        mt.update_leaf(index, leaf)
+    update = (time.perf_counter() - start) / APPENDS
+
+    print(
+        f"\n{len(leaves)} leaves, {options}: append_leaf "
+        f"{append * 1e3:.3f}ms, update_leaf {update * 1e3:.3f}ms",
+        file=sys.stderr,
+    )
+    expected = MerkleTree(**options)
+    expected.build_merkle_tree(extra + leaves[APPENDS:] + extra)
+    assert mt.get_root_tree() == expected.get_root_tree()
+    # Both hash a path to the root, none copies the tree
+    assert append < 5 * update
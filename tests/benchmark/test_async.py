@@ -0,0 +1,65 @@
+"""
+Benchmark of the asyncio facade under concurrent requests.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import asyncio
+import sys
+import time
+
+import pytest
+
+from src.apps.aio import AsyncMerkleTree
+from src.apps.merkle import MerkleTree
+
+REQUESTS = 20_000
+
+
+@pytest.fixture(scope="module")
+def tree(leaves) -> MerkleTree:
+    mt = MerkleTree(build_proofs=False)
+    mt.build_merkle_tree(leaves)
+    return mt
+
+
+async def _serve(verify, items, root) -> list[float]:
+    """Send all the requests at once, return the latency of each one."""
+    async def request(leaf, proof):
+        start = time.perf_counter()
+        assert await verify(proof, root, leaf)
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(request(*item) for item in items))
+
+
+def _p99(latencies: list[float]) -> float:
+    return sorted(latencies)[int(len(latencies) * 0.99)]
+
+
+def test_verify_is_batched_under_load(tree):
+    count = min(REQUESTS, tree.count_leaves())
+    leaves = tree.get_leaves()
+    items = [(leaves[i], tree.get_merkle_proof_at(i)) for i in range(count)]
+    root = tree.get_root_tree()
+
+    async def one_by_one(proof, root, leaf):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, tree.verify, proof, root, leaf)
+
+    start = time.perf_counter()
+    naive = asyncio.run(_serve(one_by_one, items, root))
+    naive_time = time.perf_counter() - start
+
+    amt = AsyncMerkleTree(tree)
+    start = time.perf_counter()
+    batched = asyncio.run(_serve(amt.verify, items, root))
+    batched_time = time.perf_counter() - start
+
+    print(
+        f"\n{count} concurrent verify: one by one {count / naive_time:,.0f}/s "
+        f"p99 {_p99(naive) * 1e3:.0f}ms, batched "
+        f"{count / batched_time:,.0f}/s p99 {_p99(batched) * 1e3:.0f}ms",
+        file=sys.stderr,
+    )
+    assert batched_time < naive_time
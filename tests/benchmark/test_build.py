@@ -0,0 +1,67 @@
+"""
+Benchmark of the merkle tree build.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import sys
+import time
+
+from Crypto.Hash import keccak
+
+from src.apps.merkle import MerkleTree
+
+
+def _legacy_hash_pair(a: str, b: str) -> str:
+    if a < b:
+        return keccak.new(
+            digest_bits=256, data=(a.encode() + b.encode())
+        ).hexdigest()
+    return keccak.new(
+        digest_bits=256, data=(b.encode() + a.encode())
+    ).hexdigest()
+
+
+def _legacy_build(values: list[str], tree: list[str], proofs: dict) -> None:
+    """The recursive build replaced by the level-batched build."""
+    values_copy = values.copy()
+    new_values: list[str] = []
+    _ = len(tree)
+    for i in range(0, len(values_copy), 2):
+        pair = values_copy[i:i + 2]
+        if len(pair) == 2:
+            hash = _legacy_hash_pair(pair[0], pair[1])
+            proofs[pair[0]] = (pair[1], hash)
+            proofs[pair[1]] = (pair[0], hash)
+            tree.append(hash)
+        else:
+            hash = pair[0]
+        new_values.append(hash)
+    if len(new_values) > 1:
+        _legacy_build(new_values, tree, proofs)
+
+
+def _timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def test_build_is_faster_than_recursive_build(leaves):
+    tree = leaves.copy()
+    legacy = _timed(_legacy_build, leaves, tree, {})
+
+    mt = MerkleTree()
+    current = _timed(mt.build_merkle_tree, leaves)
+
+    binary = MerkleTree(binary=True)
+    current_binary = _timed(binary.build_merkle_tree, leaves)
+
+    print(
+        f"\n{len(leaves)} leaves: recursive {legacy:.2f}s, "
+        f"level-batched {current:.2f}s, binary {current_binary:.2f}s",
+        file=sys.stderr,
+    )
+    assert mt.get_merkle_tree() == tree
+    assert binary.get_root_tree() == tree[-1]
+    assert current < legacy
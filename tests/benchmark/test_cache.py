@@ -0,0 +1,41 @@
+"""
+Benchmark of the proof cache with skewed lookups.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import random
+import sys
+import time
+
+from src.apps.cache import ProofCache
+from src.apps.merkle import MerkleTree
+
+LOOKUPS = 200_000
+
+
+def test_proof_cache_with_skewed_lookups(leaves):
+    # 90% of the lookups on 1% of the leaves
+    rng = random.Random(0)
+    hot = leaves[:max(1, len(leaves) // 100)]
+    lookups = [
+        rng.choice(hot) if rng.random() < 0.9 else rng.choice(leaves)
+        for _ in range(LOOKUPS)
+    ]
+
+    timings = {}
+    for name, cache in (("no cache", None), ("cache", ProofCache(2 ** 16))):
+        mt = MerkleTree(proof_cache=cache)
+        mt.build_merkle_tree(leaves)
+        start = time.perf_counter()
+        for leaf in lookups:
+            mt.get_merkle_proof(leaf)
+        timings[name] = time.perf_counter() - start
+
+    print(
+        f"\n{LOOKUPS} skewed lookups: "
+        + ", ".join(f"{name} {LOOKUPS / t:,.0f}/s" for name, t in timings.items())
+        + f", {cache.stats()}",
+        file=sys.stderr,
+    )
+    assert timings["cache"] < timings["no cache"]
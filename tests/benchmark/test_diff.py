@@ -0,0 +1,50 @@
+"""
+Benchmark of an anti-entropy sync between two replicas.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import random
+import sys
+import time
+
+from src.apps.merkle import MerkleTree
+from src.benchmarks.generators import make_leaves
+
+CHANGES = 10
+
+
+def test_diff_replicas(leaves):
+    rng = random.Random(0)
+    changed = leaves.copy()
+    indexes = sorted(rng.sample(range(len(leaves)), CHANGES))
+    for index, leaf in zip(indexes, make_leaves(CHANGES, seed=1)):
+        changed[index] = leaf
+
+    local = MerkleTree(binary=True)
+    local.build_merkle_tree(leaves)
+    remote = MerkleTree(binary=True)
+    remote.build_merkle_tree(changed)
+
+    start = time.perf_counter()
+    full = [i for i, (a, b) in enumerate(zip(leaves, changed)) if a != b]
+    compare_leaves = time.perf_counter() - start
+
+    nodes = []
+
+    def get_nodes(level, positions):
+        nodes.append(len(positions))
+        return remote.get_nodes(level, positions)
+
+    start = time.perf_counter()
+    result = local.diff_remote(get_nodes, remote.count_leaves())
+    diff = time.perf_counter() - start
+
+    print(
+        f"\n{len(leaves)} leaves, {CHANGES} changes: leaf lists "
+        f"{compare_leaves * 1e3:.1f}ms, diff {diff * 1e3:.2f}ms "
+        f"({sum(nodes)} nodes in {len(nodes)} round trips)",
+        file=sys.stderr,
+    )
+    assert result == full == indexes
+    assert diff < compare_leaves
@@ -0,0 +1,36 @@
+"""
+Micro-benchmark of the hash backends.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import hashlib
+import sys
+import timeit
+
+import pytest
+from Crypto.Hash import keccak
+
+from src.apps.hashing import get_hash_backend, hash_backend_names
+
+PAIRS = 100_000
+A = hashlib.sha256(b"a").digest()
+B = hashlib.sha256(b"b").digest()
+
+
+def test_legacy_pair_cost():
+    a, b = A.hex(), B.hex()
+    seconds = timeit.timeit(
+        lambda: keccak.new(
+            digest_bits=256, data=(a.encode() + b.encode())
+        ).hexdigest(),
+        number=PAIRS,
+    )
+    print(f"\nlegacy keccak: {seconds / PAIRS * 1e6:.2f}us/pair", file=sys.stderr)
+
+
+@pytest.mark.parametrize("name", hash_backend_names())
+def test_backend_pair_cost(name):
+    backend = get_hash_backend(name)
+    seconds = timeit.timeit(lambda: backend.hash_pair(A, B), number=PAIRS)
+    print(f"\n{name}: {seconds / PAIRS * 1e6:.2f}us/pair", file=sys.stderr)
@@ -0,0 +1,132 @@
+"""
+Benchmark of the cost of the instrumentation.
+
+Without observer, the public methods must cost the same as the code they
+wrap, without their instrumentation; with ``MerkleStats`` the cost is
+reported.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import statistics
+import sys
+import timeit
+from typing import Sequence, Union
+
+import pytest
+
+from src.apps.instrumentation import MerkleStats
+from src.apps.merkle import MerkleTree
+
+LOOKUPS = 2_000
+BUILD_LEAVES = 20_000
+REPEAT = 101
+# Paired medians of uninstrumented against uninstrumented runs stay
+# within 2%, the tolerance is the noise floor of the machine
+TOLERANCE = 0.05
+
+
+def _overhead(baseline, func) -> float:
+    """Median of the relative cost of ``func`` over ``baseline``.
+
+    Each run of ``func`` is paired with a run of ``baseline``, in
+    alternating order, so that drifts of the machine hit both.
+    """
+    ratios = []
+    for i in range(REPEAT):
+        first, second = (baseline, func) if i % 2 else (func, baseline)
+        elapsed = {
+            first: timeit.timeit(first, number=1),
+            second: timeit.timeit(second, number=1),
+        }
+        ratios.append(elapsed[func] / elapsed[baseline])
+    return statistics.median(ratios) - 1
+
+
+def _proof(tree: MerkleTree, leaf: str):
+    """``get_merkle_proof`` without its instrumentation."""
+    if tree.proof_cache is not None:
+        return tree._cached_proof(leaf, tree._find_proof)
+    return tree._find_proof(leaf)
+
+
+def _verify(
+    tree: MerkleTree,
+    proof: Union[Sequence[str], bytes, memoryview],
+    root_tree: str,
+    leaf: str,
+) -> bool:
+    """``verify`` without its instrumentation."""
+    try:
+        if isinstance(proof, (bytes, bytearray, memoryview)):
+            return tree._verify_encoded(proof, leaf) == root_tree
+        return tree._verify(proof, leaf) == root_tree
+    except ValueError:
+        return False
+
+
+@pytest.fixture(scope="module")
+def trees(leaves) -> dict:
+    trees = {}
+    for name, observer in (("disabled", None), ("enabled", MerkleStats())):
+        mt = MerkleTree(observer=observer)
+        mt.build_merkle_tree(leaves)
+        trees[name] = mt
+    return trees
+
+
+def test_build_overhead(leaves):
+    values = leaves[:BUILD_LEAVES]
+
+    def baseline():
+        MerkleTree()._build_merkle_tree(values)
+
+    overheads = {
+        "disabled": _overhead(
+            baseline, lambda: MerkleTree().build_merkle_tree(values)
+        ),
+        "enabled": _overhead(
+            baseline,
+            lambda: MerkleTree(observer=MerkleStats()).build_merkle_tree(
+                values
+            ),
+        ),
+    }
+
+    print(
+        f"\nbuild {len(values)} leaves, median overhead: "
+        + ", ".join(f"{name} {o:+.1%}" for name, o in overheads.items()),
+        file=sys.stderr,
+    )
+    assert overheads["disabled"] < TOLERANCE
+
+
+def test_proof_and_verify_overhead(leaves, trees):
+    sample = leaves[:LOOKUPS]
+    mt = trees["disabled"]
+    proofs = [mt.get_merkle_proof(leaf) for leaf in sample]
+    root = mt.get_root_tree()
+    items = list(zip(sample, proofs))
+
+    baselines = {
+        "proof": lambda: [_proof(mt, leaf) for leaf in sample],
+        "verify": lambda: [_verify(mt, p, root, leaf) for leaf, p in items],
+    }
+    overheads = {}
+    for name, tree in trees.items():
+        overheads[f"{name} proof"] = _overhead(
+            baselines["proof"],
+            lambda: [tree.get_merkle_proof(leaf) for leaf in sample],
+        )
+        overheads[f"{name} verify"] = _overhead(
+            baselines["verify"],
+            lambda: [tree.verify(p, root, leaf) for leaf, p in items],
+        )
+
+    print(
+        f"\n{len(sample)} lookups, median overhead: "
+        + ", ".join(f"{name} {o:+.1%}" for name, o in overheads.items()),
+        file=sys.stderr,
+    )
+    for call in ("proof", "verify"):
+        assert overheads[f"disabled {call}"] < TOLERANCE
@@ -0,0 +1,43 @@
+"""
+Benchmark of the leaf index.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+
+LOOKUPS = 1_000
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_index_of(leaves, binary):
+    sample = random.Random(0).sample(leaves, LOOKUPS)
+
+    timings = {}
+    for leaf_index in (False, True):
+        tracemalloc.start()
+        mt = MerkleTree(binary=binary, build_proofs=False, leaf_index=leaf_index)
+        mt.build_merkle_tree(leaves)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        positions = [mt.index_of(leaf) for leaf in sample]
+        timings[leaf_index] = (time.perf_counter() - start, memory)
+        assert [leaves[i] for i in positions] == sample
+
+    (scan, scan_memory), (indexed, indexed_memory) = timings.values()
+    print(
+        f"\n{len(leaves)} leaves, binary={binary}: index_of scan "
+        f"{LOOKUPS / scan:,.0f}/s, indexed {LOOKUPS / indexed:,.0f}/s, "
+        f"index {(indexed_memory - scan_memory) / len(leaves):.0f} B/leaf",
+        file=sys.stderr,
+    )
+    assert indexed < scan
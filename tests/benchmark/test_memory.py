@@ -0,0 +1,71 @@
+"""
+Benchmark of the memory held by a merkle tree.
+
+The hex mode keeps a string per node and the proofs by node, the binary
+mode packs the nodes in a buffer per level. ``MERKLE_BENCHMARK_MEMORY_LEAVES``
+sets the numbers of leaves (default 100,000, 1,000,000 and 10,000,000).
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+from src.benchmarks.generators import make_leaves
+
+SIZES = [
+    int(size) for size in os.environ.get(
+        "MERKLE_BENCHMARK_MEMORY_LEAVES", "100000,1000000,10000000"
+    ).split(",")
+]
+
+MODES = {
+    "hex": {},
+    "hex without proofs": {"build_proofs": False},
+    "binary": {"binary": True},
+}
+
+
+def _retained(leaves: list[str], **options) -> int:
+    """The memory held by a tree built from ``leaves``."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    mt = MerkleTree(**options)
+    mt.build_merkle_tree(leaves)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del mt
+    return after - before
+
+
+def test_empty_tree_overhead():
+    count = 10_000
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    trees = [MerkleTree(binary=True) for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"\nempty tree: {(after - before) / count:.0f} bytes, "
+        f"{sys.getsizeof(trees[0])} bytes for the object",
+        file=sys.stderr,
+    )
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_tree_memory(size):
+    leaves = make_leaves(size)
+    retained = {name: _retained(leaves, **opts) for name, opts in MODES.items()}
+    print(
+        f"\n{size} leaves: "
+        + ", ".join(
+            f"{name} {value / size:.0f} B/leaf ({value / 2**20:,.0f}MiB)"
+            for name, value in retained.items()
+        ),
+        file=sys.stderr,
+    )
+    assert retained["binary"] < retained["hex without proofs"] < retained["hex"]
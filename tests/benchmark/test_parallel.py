@@ -0,0 +1,37 @@
+"""
+Benchmark of the merkle tree build with a process pool.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+
+
+@pytest.fixture(scope="module")
+def serial_root(leaves) -> str:
+    mt = MerkleTree(binary=True)
+    mt.build_merkle_tree(leaves)
+    return mt.get_root_tree()
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4, 8])
+def test_parallel_build_scaling(leaves, serial_root, workers):
+    mt = MerkleTree(binary=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        mt.build_merkle_tree(leaves, executor=executor, chunk_size=2 ** 16)
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{len(leaves)} leaves, {workers} workers "
+        f"({os.cpu_count()} cpus): {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    assert mt.get_root_tree() == serial_root
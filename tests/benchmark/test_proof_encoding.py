@@ -0,0 +1,74 @@
+"""
+Benchmark of the compact binary proof encoding.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import json
+import sys
+import time
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+
+PROOFS = 100_000
+
+
+@pytest.fixture(scope="module")
+def tree(leaves) -> MerkleTree:
+    mt = MerkleTree(binary=True, build_proofs=False)
+    mt.build_merkle_tree(leaves)
+    return mt
+
+
+def test_encode_decode_throughput(tree):
+    count = min(PROOFS, tree.count_leaves())
+    proofs = [tree.get_merkle_proof_at(i) for i in range(count)]
+
+    start = time.perf_counter()
+    encoded = [tree.encode_proof(proof) for proof in proofs]
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [tree.decode_proof(data) for data in encoded]
+    decode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    payloads = [json.dumps(proof) for proof in proofs]
+    json_encode = time.perf_counter() - start
+
+    encoded_size = sum(map(len, encoded))
+    json_size = sum(map(len, payloads))
+    print(
+        f"\n{count} proofs: encode {count / encode:,.0f}/s, "
+        f"decode {count / decode:,.0f}/s, json {count / json_encode:,.0f}/s, "
+        f"{encoded_size / count:.0f} B/proof, "
+        f"{json_size / encoded_size:.2f}x smaller than json",
+        file=sys.stderr,
+    )
+    assert decoded == proofs
+    assert 2 * encoded_size < json_size
+
+
+def test_verify_encoded_throughput(tree):
+    count = min(PROOFS, tree.count_leaves())
+    leaves = tree.get_leaves()
+    items = [(leaves[i], tree.get_merkle_proof_at(i)) for i in range(count)]
+    encoded = [(leaf, tree.encode_proof(proof)) for leaf, proof in items]
+    root = tree.get_root_tree()
+
+    start = time.perf_counter()
+    expected = [tree.verify(proof, root, leaf) for leaf, proof in items]
+    hex_verify = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = [tree.verify(data, root, leaf) for leaf, data in encoded]
+    encoded_verify = time.perf_counter() - start
+
+    print(
+        f"\n{count} proofs: verify hex {count / hex_verify:,.0f}/s, "
+        f"encoded {count / encoded_verify:,.0f}/s",
+        file=sys.stderr,
+    )
+    assert result == expected == [True] * count
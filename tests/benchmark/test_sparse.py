@@ -0,0 +1,50 @@
+"""
+Benchmark of the sparse merkle tree.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import sys
+import time
+import tracemalloc
+
+from src.apps.merkle import SparseMerkleTree
+from src.benchmarks.generators import make_leaves
+
+KEYS = 10_000
+
+
+def test_sparse_merkle_tree_throughput():
+    keys = make_leaves(KEYS)
+    smt = SparseMerkleTree()
+
+    start = time.perf_counter()
+    for key in keys:
+        smt.set(key, key)
+    sets = time.perf_counter() - start
+
+    tracemalloc.start()
+    other = SparseMerkleTree()
+    for key in keys[:KEYS // 10]:
+        other.set(key, key)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    proofs = [smt.get_proof(key) for key in keys]
+    proving = time.perf_counter() - start
+
+    root = smt.get_root_tree()
+    start = time.perf_counter()
+    assert all(
+        smt.verify(proof, root, key, key) for key, proof in zip(keys, proofs)
+    )
+    verifying = time.perf_counter() - start
+
+    siblings = sum(len(siblings) for _, siblings in proofs) / KEYS
+    print(
+        f"\n{KEYS} keys: set {KEYS / sets:,.0f}/s, proof {KEYS / proving:,.0f}/s"
+        f", verify {KEYS / verifying:,.0f}/s, {memory / (KEYS // 10) / 1024:.1f}KiB/key"
+        f", {siblings:.1f} siblings/proof",
+        file=sys.stderr,
+    )
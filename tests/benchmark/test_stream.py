@@ -0,0 +1,38 @@
+"""
+Benchmark of the memory used by the streaming build.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import hashlib
+import sys
+import tracemalloc
+from typing import Iterator
+
+from src.apps.merkle import MerkleTree
+
+from tests.benchmark.conftest import LEAVES
+
+
+def _stream(count: int) -> Iterator[str]:
+    for i in range(count):
+        yield hashlib.sha256(i.to_bytes(8, "big")).hexdigest()
+
+
+def _peak(count: int) -> int:
+    tracemalloc.start()
+    MerkleTree.root_from_stream(_stream(count), chunk_size=4096)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def test_stream_memory_does_not_depend_on_leaves():
+    small = _peak(LEAVES // 10)
+    large = _peak(LEAVES)
+    print(
+        f"\npeak memory: {LEAVES // 10} leaves {small / 2**20:.1f}MiB, "
+        f"{LEAVES} leaves {large / 2**20:.1f}MiB",
+        file=sys.stderr,
+    )
+    assert large < 2 * small
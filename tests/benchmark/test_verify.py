@@ -0,0 +1,49 @@
+"""
+Benchmark of the proof verification.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import random
+import sys
+import time
+
+import pytest
+
+from src.apps.merkle import MerkleTree, verify_batch
+
+PROOFS = 100_000
+
+
+@pytest.fixture(scope="module")
+def tree(leaves) -> MerkleTree:
+    mt = MerkleTree(build_proofs=False)
+    mt.build_merkle_tree(leaves)
+    return mt
+
+
+@pytest.mark.parametrize("sample", ["contiguous", "random"])
+def test_verify_batch_throughput(tree, sample):
+    count = min(PROOFS, tree.count_leaves())
+    indexes = range(count)
+    if sample == "random":
+        indexes = random.Random(0).sample(range(tree.count_leaves()), count)
+    leaves = tree.get_leaves()
+    items = [(leaves[i], tree.get_merkle_proof_at(i)) for i in indexes]
+    root = tree.get_root_tree()
+
+    start = time.perf_counter()
+    expected = [tree.verify(proof, root, leaf) for leaf, proof in items]
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = verify_batch(items, root)
+    batch = time.perf_counter() - start
+
+    print(
+        f"\n{count} {sample} proofs: verify {count / loop:,.0f}/s, "
+        f"verify_batch {count / batch:,.0f}/s",
+        file=sys.stderr,
+    )
+    assert result == expected == [True] * count
+    assert batch < loop
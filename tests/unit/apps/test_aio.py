@@ -0,0 +1,179 @@
+"""
+Unit tests for apps/aio.py.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from src.apps import aio
+from src.apps.aio import AsyncMerkleTree
+from src.apps.merkle import MerkleTree
+
+
+class TestAsyncMerkle:
+    """Base Test for the asyncio facade"""
+
+    @pytest.fixture
+    def leaves(self) -> list[str]:
+        return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(37)]
+
+    @pytest.fixture
+    def tree(self, leaves) -> MerkleTree:
+        mt = MerkleTree()
+        mt.build_merkle_tree(leaves)
+        return mt
+
+    @pytest.fixture
+    def executor(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            yield executor
+
+    def test_build_merkle_tree(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(executor=executor)
+        asyncio.run(amt.build_merkle_tree(leaves))
+        assert amt.get_root_tree() == tree.get_root_tree()
+        assert amt.tree.get_merkle_tree() == tree.get_merkle_tree()
+
+    def test_build_merkle_tree_keeps_options(self, leaves, tree):
+        amt = AsyncMerkleTree(MerkleTree(binary=True, build_proofs=False))
+        asyncio.run(amt.build_merkle_tree(leaves))
+        assert amt.tree.binary is True
+        assert amt.tree.build_proofs is False
+        assert amt.get_root_tree() == tree.get_root_tree()
+
+    def test_build_merkle_tree_but_raise_value_error(self, tree):
+        amt = AsyncMerkleTree(tree)
+        with pytest.raises(ValueError):
+            asyncio.run(amt.build_merkle_tree([]))
+        # The previous tree is still served
+        assert amt.tree is tree
+
+    def test_process_pool_but_raise_value_error(self, tree):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            with pytest.raises(ValueError):
+                AsyncMerkleTree(tree, executor)
+
+    def test_get_merkle_proof(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(tree, executor)
+
+        async def main():
+            return await asyncio.gather(
+                *(amt.get_merkle_proof(leaf) for leaf in leaves)
+            )
+
+        proofs = asyncio.run(main())
+        assert proofs == [tree.get_merkle_proof(leaf) for leaf in leaves]
+
+    def test_get_merkle_proof_coalesces_requests(
+        self, leaves, tree, executor, monkeypatch
+    ):
+        calls = []
+        release = threading.Event()
+        get_merkle_proof = MerkleTree.get_merkle_proof
+
+        def slow_get_merkle_proof(self, leaf):
+            calls.append(leaf)
+            release.wait()
+            return get_merkle_proof(self, leaf)
+
+        monkeypatch.setattr(
+            MerkleTree, "get_merkle_proof", slow_get_merkle_proof
+        )
+        amt = AsyncMerkleTree(tree, executor)
+
+        async def main():
+            requests = [
+                asyncio.ensure_future(amt.get_merkle_proof(leaves[0]))
+                for _ in range(10)
+            ]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*requests)
+
+        proofs = asyncio.run(main())
+        assert calls == [leaves[0]]
+        assert proofs == [get_merkle_proof(tree, leaves[0])] * 10
+        assert amt._proofs_in_flight == {}
+
+    def test_verify(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(tree, executor)
+        root = tree.get_root_tree()
+
+        async def main():
+            requests = [
+                amt.verify(tree.get_merkle_proof(leaf), root, leaf)
+                for leaf in leaves
+            ]
+            requests.append(amt.verify(tree.get_merkle_proof(leaves[0]), root, leaves[1]))
+            requests.append(amt.verify([], root, "not a leaf"))
+            return await asyncio.gather(*requests)
+
+        assert asyncio.run(main()) == [True] * len(leaves) + [False, False]
+
+    def test_verify_malformed_request(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(tree, executor)
+        root = tree.get_root_tree()
+
+        async def main():
+            return await asyncio.gather(
+                amt.verify(tree.get_merkle_proof(leaves[0]), root, leaves[0]),
+                amt.verify([1, 2], root, leaves[1]),
+                amt.verify(tree.get_merkle_proof(leaves[2]), root, None),
+                amt.verify(tree.get_merkle_proof(leaves[3]), root, leaves[3]),
+            )
+
+        # The malformed requests do not fail the valid ones of the batch
+        assert asyncio.run(main()) == [True, False, False, True]
+
+    def test_verify_encoded_proof(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(tree, executor)
+        root = tree.get_root_tree()
+        encoded = tree.encode_proof(tree.get_merkle_proof(leaves[0]))
+
+        async def main():
+            return await asyncio.gather(
+                amt.verify(tree.get_merkle_proof(leaves[1]), root, leaves[1]),
+                amt.verify(encoded, root, leaves[0]),
+                amt.verify(encoded, root, leaves[1]),
+            )
+
+        assert asyncio.run(main()) == [True, True, False]
+        items = [(leaves[0], encoded), (leaves[1], encoded)]
+        results = asyncio.run(amt.verify_batch(items, root))
+        assert results == [True, False]
+
+    def test_verify_batches_requests(self, leaves, tree, monkeypatch):
+        batches = []
+        verify_batch = aio.verify_batch
+
+        def counting_verify_batch(items, *args):
+            batches.append(len(items))
+            return verify_batch(items, *args)
+
+        monkeypatch.setattr(aio, "verify_batch", counting_verify_batch)
+        amt = AsyncMerkleTree(tree, max_batch_size=16)
+        root = tree.get_root_tree()
+
+        async def main():
+            return await asyncio.gather(
+                *(
+                    amt.verify(tree.get_merkle_proof(leaf), root, leaf)
+                    for leaf in leaves
+                ),
+                amt.verify(tree.get_merkle_proof(leaves[0]), "other", leaves[0]),
+            )
+
+        assert asyncio.run(main()) == [True] * len(leaves) + [False]
+        assert sorted(batches) == [1, 5, 16, 16]
+
+    def test_verify_batch(self, leaves, tree, executor):
+        amt = AsyncMerkleTree(tree, executor)
+        items = [(leaf, tree.get_merkle_proof(leaf)) for leaf in leaves]
+        results = asyncio.run(amt.verify_batch(items, tree.get_root_tree()))
+        assert results == [True] * len(leaves)
@@ -0,0 +1,70 @@
+"""
+Unit tests for apps/cache.py.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import pytest
+
+from src.apps.cache import ProofCache
+
+
+class TestProofCache:
+    """Base Test for the proof cache"""
+
+    PROOF = ("a" * 64, "b" * 64)
+
+    def test_get_and_put(self):
+        cache = ProofCache()
+        assert cache.get("leaf", 1) is None
+        cache.put("leaf", self.PROOF, 1)
+        assert cache.get("leaf", 1) is self.PROOF
+        assert cache.stats() == {
+            "hits": 1, "misses": 1, "evictions": 0, "entries": 1, "bytes": 128
+        }
+
+    def test_new_generation_empties_the_cache(self):
+        cache = ProofCache()
+        cache.put("leaf", self.PROOF, 1)
+        assert cache.get("leaf", 2) is None
+        assert len(cache) == 0
+        cache.put("leaf", self.PROOF, 1)
+        assert cache.get("leaf", 2) is None
+
+    def test_evicts_least_recently_used(self):
+        cache = ProofCache(max_entries=2)
+        cache.put("a", self.PROOF, 1)
+        cache.put("b", self.PROOF, 1)
+        cache.get("a", 1)
+        cache.put("c", self.PROOF, 1)
+        assert cache.get("b", 1) is None
+        assert cache.get("a", 1) is self.PROOF
+        assert cache.get("c", 1) is self.PROOF
+        assert cache.evictions == 1
+
+    def test_evicts_above_max_bytes(self):
+        cache = ProofCache(max_bytes=300)
+        cache.put("a", self.PROOF, 1)
+        cache.put("b", self.PROOF, 1)
+        cache.put("b", self.PROOF, 1)
+        assert cache.stats()["bytes"] == 256
+        cache.put("c", self.PROOF, 1)
+        assert cache.get("a", 1) is None
+        assert cache.stats()["bytes"] == 256
+        # Larger than the cache, not cached
+        cache.put("d", self.PROOF * 3, 1)
+        assert cache.get("d", 1) is None
+        assert len(cache) == 2
+
+    def test_clear(self):
+        cache = ProofCache()
+        cache.put("a", self.PROOF, 1)
+        cache.clear()
+        assert cache.get("a", 1) is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_but_raise_value_error(self):
+        with pytest.raises(ValueError):
+            ProofCache(max_entries=0)
+        with pytest.raises(ValueError):
+            ProofCache(max_bytes=0)
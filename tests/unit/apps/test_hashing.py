@@ -0,0 +1,162 @@
+"""
+Unit tests for apps/hashing.py.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import copy
+import hashlib
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from Crypto.Hash import keccak
+
+from src.apps import hashing
+from src.apps.hashing import (
+    HASH_BACKENDS,
+    HashBackend,
+    get_hash_backend,
+    get_hash_backend_name,
+    hash_backend_names,
+    register_hash_backend,
+)
+from src.apps.merkle import MerkleTree, verify_batch
+
+
+class TestHashing:
+    """Base Test for the hash backends"""
+
+    # Sorted pair of digests
+    A, B = sorted([hashlib.sha256(b"a").digest(), hashlib.sha256(b"b").digest()])
+
+    @pytest.fixture
+    def leaves(self) -> list[str]:
+        return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(37)]
+
+    def test_backend_names(self):
+        assert hash_backend_names() == [
+            "keccak", "sha3_256", "blake2b", "blake2s", "sha256d"
+        ]
+
+    def test_get_hash_backend_but_raise_value_error(self):
+        with pytest.raises(ValueError):
+            get_hash_backend("md5")
+        with pytest.raises(ValueError):
+            MerkleTree(hash_backend="md5")
+
+    def test_keccak_backend_is_compatible(self):
+        backend = get_hash_backend("keccak")
+        expected = keccak.new(
+            digest_bits=256, data=(self.A.hex() + self.B.hex()).encode()
+        ).digest()
+        assert backend.hash_pair(self.B, self.A) == expected
+        assert backend.hash_hex_pair("some", "data") == MerkleTree._hash_pair(
+            "some", "data"
+        )
+
+    @pytest.mark.parametrize("name, expected", [
+        ("sha3_256", hashlib.sha3_256(A + B).digest()),
+        ("blake2b", hashlib.blake2b(A + B, digest_size=32).digest()),
+        ("blake2s", hashlib.blake2s(A + B).digest()),
+        ("sha256d", hashlib.sha256(hashlib.sha256(A + B).digest()).digest()),
+    ])
+    def test_raw_backends(self, name, expected):
+        backend = get_hash_backend(name)
+        assert backend.hash_pair(self.B, self.A) == expected
+        assert backend.hash_hex_pair(self.A.hex(), self.B.hex()) == expected.hex()
+
+    @pytest.mark.parametrize("name", ["keccak", "sha3_256"])
+    def test_hash_ordered_pair(self, name):
+        backend = get_hash_backend(name)
+        assert backend.hash_ordered_pair(self.A, self.B) == backend.hash_pair(
+            self.B, self.A
+        )
+        assert backend.hash_ordered_pair(self.B, self.A) != backend.hash_pair(
+            self.B, self.A
+        )
+
+    def test_keccak_backend_without_native_state(self, monkeypatch):
+        expected = get_hash_backend("keccak").hash_pair(self.A, self.B)
+        monkeypatch.setattr(hashing, "_NATIVE_KECCAK", False)
+        backend = get_hash_backend("keccak")
+        assert backend.hash_pair(self.A, self.B) == expected
+        assert isinstance(backend._local.hasher, hashing._KeccakNew)
+
+    @pytest.mark.parametrize("name", list(HASH_BACKENDS))
+    def test_backend_pickles(self, name):
+        backend = get_hash_backend(name)
+        expected = backend.hash_pair(self.A, self.B)
+        for other in (pickle.loads(pickle.dumps(backend)), copy.deepcopy(backend)):
+            assert type(other) is type(backend)
+            assert other.hash_pair(self.A, self.B) == expected
+
+    def test_hash_backend_is_abstract(self):
+        with pytest.raises(TypeError):
+            HashBackend()
+
+    def test_keccak_backend_in_threads(self):
+        backend = get_hash_backend("keccak")
+        expected = backend.hash_pair(self.A, self.B)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = executor.map(
+                lambda _: backend.hash_pair(self.A, self.B), range(100)
+            )
+            assert set(results) == {expected}
+
+    @pytest.mark.parametrize("name", list(HASH_BACKENDS))
+    def test_merkle_tree_with_backend(self, name, leaves):
+        mt = MerkleTree(hash_backend=name)
+        mt.build_merkle_tree(leaves)
+        binary = MerkleTree(hash_backend=name, binary=True)
+        binary.build_merkle_tree(leaves)
+        assert mt.get_merkle_tree() == binary.get_merkle_tree()
+
+        root = mt.get_root_tree()
+        items = [(leaf, mt.get_merkle_proof(leaf)) for leaf in leaves]
+        assert all(mt.verify(proof, root, leaf) for leaf, proof in items)
+        assert verify_batch(items, root, hash_backend=name) == [True] * 37
+        assert mt.verify(items[0][1], root, "not present") is False
+
+    def test_register_hash_backend(self, leaves):
+        class Sha512Backend(HashBackend):
+            name = "sha512_256"
+
+            def digest(self, data: bytes) -> bytes:
+                return hashlib.sha512(data).digest()[:32]
+
+        register_hash_backend(Sha512Backend)
+        try:
+            mt = MerkleTree(hash_backend="sha512_256")
+            mt.build_merkle_tree(leaves[:2])
+            assert mt.get_root_tree() == hashlib.sha512(
+                bytes.fromhex(min(leaves[:2]) + max(leaves[:2]))
+            ).hexdigest()[:64]
+            with pytest.raises(ValueError):
+                register_hash_backend(Sha512Backend)
+        finally:
+            del HASH_BACKENDS["sha512_256"]
+
+    def test_get_hash_backend_name(self):
+        for name in hash_backend_names():
+            backend = get_hash_backend(name)
+            assert get_hash_backend_name(backend.backend_id) == name
+        with pytest.raises(ValueError):
+            get_hash_backend_name(0)
+        with pytest.raises(ValueError):
+            get_hash_backend_name(255)
+
+    def test_register_hash_backend_but_raise_value_error(self):
+        class Sha512Backend(HashBackend):
+            name = "sha512_256"
+            backend_id = 1
+
+            def digest(self, data: bytes) -> bytes:
+                return hashlib.sha512(data).digest()[:32]
+
+        with pytest.raises(ValueError):
+            register_hash_backend(Sha512Backend)
+        Sha512Backend.backend_id = 256
+        with pytest.raises(ValueError):
+            register_hash_backend(Sha512Backend)
+        assert "sha512_256" not in HASH_BACKENDS
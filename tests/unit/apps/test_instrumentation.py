@@ -0,0 +1,106 @@
+"""
+Unit tests for apps/instrumentation.py.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.apps.instrumentation import (
+    LatencyHistogram,
+    MerkleObserver,
+    MerkleStats,
+)
+from src.apps.merkle import MerkleTree
+
+
+class TestInstrumentation:
+    """Base Test for the instrumentation of the merkle trees"""
+
+    @pytest.fixture
+    def leaves(self) -> list[str]:
+        return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(37)]
+
+    def test_build_counters(self):
+        mt = MerkleTree(observer=MerkleStats())
+        mt.build_merkle_tree(["a", "b", "c", "d", "e"])
+        stats = mt.stats()
+        assert stats["hash_calls"] == 4
+        assert stats["bytes_hashed"] == 4 * 128
+        assert stats["nodes_written"] == 4
+        assert stats["proof_entries"] == 8
+        assert list(stats["build_level_seconds"]) == [1, 2, 3]
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_build_with_executor_counters(self, leaves, binary):
+        mt = MerkleTree(binary=binary, observer=MerkleStats())
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            mt.build_merkle_tree(leaves, executor=executor, chunk_size=8)
+        stats = mt.stats()
+        assert stats["hash_calls"] == len(leaves) - 1
+        assert stats["proof_entries"] == (0 if binary else 2 * (len(leaves) - 1))
+        # Only the levels above the subtrees are timed
+        assert list(stats["build_level_seconds"]) == [4, 5, 6]
+
+    def test_binary_and_backend_counters(self, leaves):
+        mt = MerkleTree(binary=True, hash_backend="sha3_256", observer=MerkleStats())
+        mt.build_merkle_tree(leaves)
+        stats = mt.stats()
+        assert stats["hash_calls"] == len(leaves) - 1
+        assert stats["bytes_hashed"] == (len(leaves) - 1) * 64
+        assert stats["proof_entries"] == 0
+
+    def test_mutation_counters(self, leaves):
+        observer = MerkleStats()
+        mt = MerkleTree(observer=observer)
+        mt.build_merkle_tree(leaves)
+        observer.reset()
+        mt.update_leaf(0, leaves[1])
+        assert mt.stats()["hash_calls"] == mt.get_depth() - 1
+
+    def test_proof_and_verify_latency(self, leaves):
+        mt = MerkleTree(observer=MerkleStats())
+        mt.build_merkle_tree(leaves)
+        root = mt.get_root_tree()
+        for leaf in leaves:
+            assert mt.verify(mt.get_merkle_proof(leaf), root, leaf) is True
+        mt.get_merkle_proof_at(0)
+        assert mt.verify([], root, "not a leaf") is False
+        stats = mt.stats()
+        assert stats["proof_latency"]["count"] == len(leaves) + 1
+        assert stats["verify_latency"]["count"] == len(leaves) + 1
+        assert stats["verify_latency"]["p99_us"] >= stats["verify_latency"]["p50_us"]
+
+    def test_custom_observer(self, leaves):
+        class Levels(MerkleObserver):
+            def __init__(self):
+                self.levels = []
+
+            def on_build_level(self, level, seconds):
+                self.levels.append(level)
+
+        observer = Levels()
+        mt = MerkleTree(observer=observer)
+        mt.build_merkle_tree(leaves)
+        assert observer.levels == list(range(1, mt.get_depth()))
+        assert mt.stats() == {}
+
+    def test_no_observer(self, leaves):
+        mt = MerkleTree()
+        mt.build_merkle_tree(leaves)
+        assert mt.stats() == {}
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(50) == 0.0
+        for seconds in (0.5e-6, 1e-6, 3e-6, 3e-6, 100e-6):
+            histogram.add(seconds)
+        assert histogram.buckets == {1: 2, 4: 2, 128: 1}
+        assert histogram.percentile(50) == 4.0
+        assert histogram.percentile(100) == 128.0
+        snapshot = histogram.snapshot()
+        assert snapshot["count"] == 5
+        assert snapshot["max_us"] == pytest.approx(100)
@@ -4,11 +4,30 @@ Unit tests for apps/Merkle.py.
 Author: 
     Arnaud SENE, arnaud.sene@pm.me
 """
+import copy
+import json
+import pickle
 import pytest
-from src.apps.merkle import MerkleTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.apps.cache import ProofCache
+from src.apps.hashing import KeccakBackend
+from src.apps.merkle import (
+    MerkleTree,
+    MerkleTreeBuilder,
+    SparseMerkleTree,
+    Subtree,
+    verify_batch,
+)
 from Crypto.Hash import keccak   
     
 
+def build_shard(values: list[str], start: int) -> Subtree:
+    """Build a shard in a process standing in for a host."""
+    mt = MerkleTree(binary=True)
+    mt.build_merkle_tree(values)
+    return mt.export_subtree(start)
+
+
 class TestMerkle:
     """Base Test for Merkle"""
     
@@ -148,6 +167,224 @@ class TestMerkle:
         self.mt.build_merkle_tree(self.odd_hashed_big_data)
         assert self.mt.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED    
     
+    def test_build_merkle_tree_twice_replaces_the_tree(self):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        assert self.mt.get_root_tree() == self.ODD_ROOT_EXPECTED
+        assert self.mt.get_size() == 9
+        assert self.mt.get_depth() == 4
+        assert self.mt.get_leaves() == self.odd_hashed_data
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_build_merkle_tree_with_executor(self, binary):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        mt = MerkleTree(binary=binary)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            mt.build_merkle_tree(
+                self.odd_hashed_big_data, executor=executor, chunk_size=8
+            )
+        assert mt.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+        assert mt.get_merkle_tree() == self.mt.get_merkle_tree()
+        assert mt._proofs == ({} if binary else self.mt._proofs)
+        assert mt.get_depth() == self.mt.get_depth()
+
+    def test_build_merkle_tree_with_executor_but_raise_value_error(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            with pytest.raises(ValueError):
+                self.mt.build_merkle_tree(
+                    self.odd_hashed_big_data, executor=executor, chunk_size=6
+                )
+
+    # ----------------------------------------------------------------
+    # Streaming build
+    # ----------------------------------------------------------------
+    def test_root_from_stream_matches_build_merkle_tree(self):
+        for count in range(1, len(self.odd_hashed_big_data) + 1):
+            leaves = self.odd_hashed_big_data[:count]
+            self.mt.build_merkle_tree(leaves)
+            root = MerkleTree.root_from_stream(iter(leaves), chunk_size=4)
+            assert root == self.mt.get_root_tree()
+
+        # Empty strings are leaves too
+        for leaves in (["", "a"], ["", "", ""], ["a", "", "b", ""]):
+            self.mt.build_merkle_tree(leaves)
+            root = MerkleTree.root_from_stream(leaves)
+            assert root == self.mt.get_root_tree()
+
+    def test_root_from_stream_of_file(self, tmp_path):
+        path = tmp_path / "leaves.txt"
+        path.write_text("\n".join(self.odd_hashed_data) + "\n")
+        with open(path) as leaves:
+            assert MerkleTree.root_from_stream(leaves) == self.ODD_ROOT_EXPECTED
+
+    def test_root_from_stream_spills_to_tree_file(self, tmp_path):
+        path = str(tmp_path / "tree.mrkt")
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        root = MerkleTree.root_from_stream(
+            self.odd_hashed_big_data, chunk_size=3, path=path
+        )
+        mt = MerkleTree.open(path)
+        assert root == mt.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+        assert mt.get_merkle_tree() == self.mt.get_merkle_tree()
+        for leaf in self.odd_hashed_big_data:
+            assert mt.get_merkle_proof(leaf) == self.mt.get_merkle_proof(leaf)
+
+    def test_merkle_tree_builder(self):
+        builder = MerkleTreeBuilder()
+        builder.add_leaf(self.odd_hashed_data[0])
+        builder.add_leaves(self.odd_hashed_data[1:])
+        assert builder.count_leaves() == len(self.odd_hashed_data)
+        assert builder.get_root_tree() == self.ODD_ROOT_EXPECTED
+
+    def test_merkle_tree_builder_but_raise_error(self):
+        with pytest.raises(IndexError):
+            MerkleTreeBuilder().get_root_tree()
+        with pytest.raises(IndexError):
+            MerkleTree.root_from_stream([])
+        with pytest.raises(ValueError):
+            MerkleTreeBuilder(path="unused.mrkt").add_leaf("not a digest")
+
+    # ----------------------------------------------------------------
+    # Append leaves
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_append_leaves_matches_build(self, binary):
+        data = self.odd_hashed_big_data
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(data[:3])
+        mt.append_leaf(data[3])
+        mt.append_leaves(data[4:57])
+        for leaf in data[57:]:
+            mt.append_leaf(leaf)
+
+        self.mt.build_merkle_tree(data)
+        assert mt.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+        assert mt.get_merkle_tree() == self.mt.get_merkle_tree()
+        assert mt.get_leaves() == self.mt.get_leaves()
+        assert mt.get_depth() == self.mt.get_depth()
+        assert mt._proofs == ({} if binary else self.mt._proofs)
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_append_leaves_grows_levels_in_place(self, binary):
+        data = self.odd_hashed_big_data
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(data[:64])
+        levels = list(mt._levels)
+        mt.append_leaf(data[64])
+        # No level is copied, and a level is added on top
+        assert all(a is b for a, b in zip(levels, mt._levels))
+        assert len(mt._levels) == len(levels) + 1
+
+        self.mt.build_merkle_tree(data[:65])
+        assert mt.get_merkle_tree() == self.mt.get_merkle_tree()
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_get_merkle_tree_does_not_copy(self, binary):
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(self.odd_hashed_data)
+        tree = mt.get_merkle_tree()
+        assert len(tree._segments) == len(mt._levels)
+        mt.update_leaf(0, self.hash("new value"))
+        assert tree[0] == self.hash("new value")
+        assert tree[-1] == mt.get_root_tree()
+
+    def test_append_leaves_keeps_views_of_leaves(self):
+        data = self.odd_hashed_big_data
+        mt = MerkleTree(binary=True)
+        mt.build_merkle_tree(data[:4])
+        leaves = mt.get_leaves()
+        mt.append_leaf(data[4])
+        assert leaves == data[:4]
+        assert mt.get_leaves() == data[:5]
+        assert mt.get_root_tree() == MerkleTree.root_from_stream(data[:5])
+
+    def test_append_leaves_to_empty_tree(self):
+        self.mt.append_leaves(self.odd_hashed_data)
+        assert self.mt.get_root_tree() == self.ODD_ROOT_EXPECTED
+
+    def test_append_leaves_updates_proofs(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data[:4])
+        self.mt.append_leaf(self.odd_hashed_data[4])
+        for leaf in self.odd_hashed_data:
+            proofs = self.mt.get_merkle_proof(leaf)
+            assert self.mt.verify(proofs, self.ODD_ROOT_EXPECTED, leaf)
+
+    def test_append_leaves_but_raise_value_error(self):
+        with pytest.raises(ValueError):
+            self.mt.append_leaves([])
+
+    # ----------------------------------------------------------------
+    # Update leaves
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_update_leaves_matches_build(self, binary):
+        data = self.odd_hashed_big_data.copy()
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(data)
+
+        changes = {0: self.hash("a"), 1: self.hash("b"), 98: self.hash("c")}
+        mt.update_leaves(changes)
+        mt.update_leaf(50, self.hash("d"))
+        for index, value in {**changes, 50: self.hash("d")}.items():
+            data[index] = value
+
+        self.mt.build_merkle_tree(data)
+        assert mt.get_root_tree() == self.mt.get_root_tree()
+        assert mt.get_merkle_tree() == self.mt.get_merkle_tree()
+        assert mt.get_leaves() == data
+        assert mt._proofs == ({} if binary else self.mt._proofs)
+
+    def test_update_leaf_of_promoted_node(self):
+        data = self.odd_hashed_data.copy()
+        self.mt.build_merkle_tree(data)
+        data[4] = self.hash("new value")
+        self.mt.update_leaf(4, data[4])
+
+        expected = MerkleTree()
+        expected.build_merkle_tree(data)
+        assert self.mt.get_merkle_tree() == expected.get_merkle_tree()
+        assert self.mt._proofs == expected._proofs
+
+    def test_update_duplicate_leaf(self):
+        a, b, c, d = (self.hash(v) for v in "abcd")
+        self.mt.build_merkle_tree([a, b, c, a])
+        self.mt.update_leaf(0, d)
+
+        expected = MerkleTree()
+        expected.build_merkle_tree([d, b, c, a])
+        assert self.mt._proofs == expected._proofs
+        proof = self.mt.get_merkle_proof(a)
+        assert len(proof) == 2
+        assert self.mt.verify(proof, expected.get_root_tree(), a)
+
+    def test_update_and_append_duplicate_leaves_match_build(self):
+        values = [self.hash(v) for v in "abc"]
+        data = [values[i % 3] for i in range(11)]
+        self.mt.build_merkle_tree(data)
+
+        # Leaves becoming duplicates, then unique again, and appended twice
+        changes = [
+            {0: values[1]}, {1: self.hash("d")}, {0: self.hash("e"), 5: values[0]},
+            {3: self.hash("f"), 4: self.hash("g"), 6: self.hash("h")},
+        ]
+        for change in changes:
+            self.mt.update_leaves(change)
+            for index, value in change.items():
+                data[index] = value
+            expected = MerkleTree()
+            expected.build_merkle_tree(data)
+            assert self.mt._proofs == expected._proofs
+        self.mt.append_leaves(values[:2])
+        expected.build_merkle_tree(data + values[:2])
+        assert self.mt._proofs == expected._proofs
+
+    def test_update_leaf_but_raise_index_error(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        with pytest.raises(IndexError):
+            self.mt.update_leaf(5, self.hash("a"))
+        with pytest.raises(IndexError):
+            self.mt.update_leaf(-1, self.hash("a"))
+
     # ----------------------------------------------------------------
     # Build merkle proof
     # ----------------------------------------------------------------
@@ -207,6 +444,137 @@ class TestMerkle:
         leaf = self.hash("Some data")
         assert self.mt.get_merkle_proof(leaf) == expected_proof       
 
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_get_merkle_proof_at(self, binary):
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(self.odd_hashed_big_data)
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        for index, leaf in enumerate(self.odd_hashed_big_data):
+            proofs = mt.get_merkle_proof_at(index)
+            assert proofs == self.mt.get_merkle_proof(leaf)
+
+    def test_get_merkle_proof_at_with_duplicate_leaves(self):
+        data = self.odd_hashed_data + self.odd_hashed_data[:2]
+        self.mt.build_merkle_tree(data)
+        root = self.mt.get_root_tree()
+        for index, leaf in enumerate(data):
+            proofs = self.mt.get_merkle_proof_at(index)
+            assert self.mt.verify(proofs, root, leaf) is True
+        assert self.mt.get_merkle_proof_at(0) != self.mt.get_merkle_proof_at(5)
+
+    def test_get_merkle_proof_at_but_raise_index_error(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        with pytest.raises(IndexError):
+            self.mt.get_merkle_proof_at(5)
+
+    def test_get_merkle_proof_without_proofs_structure(self):
+        mt = MerkleTree(build_proofs=False)
+        mt.build_merkle_tree(self.odd_hashed_big_data)
+        mt.append_leaf(self.hash("appended"))
+        mt.update_leaf(3, self.hash("updated"))
+        assert mt._proofs == {}
+
+        root = mt.get_root_tree()
+        for leaf in mt.get_leaves():
+            proofs = mt.get_merkle_proof(leaf)
+            assert mt.verify(proofs, root, leaf) is True
+        assert mt.get_merkle_proof("not present") == []
+
+    def test_append_leaf_to_single_leaf_tree_creates_proofs(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data[:1])
+        self.mt.append_leaf(self.odd_hashed_data[1])
+        expected = MerkleTree()
+        expected.build_merkle_tree(self.odd_hashed_data[:2])
+        assert self.mt._proofs == expected._proofs
+
+    # ----------------------------------------------------------------
+    # Proof cache
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_proof_cache_returns_tuples(self, binary):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        mt = MerkleTree(binary=binary, proof_cache=ProofCache())
+        mt.build_merkle_tree(self.odd_hashed_big_data)
+        for i, leaf in enumerate(self.odd_hashed_big_data):
+            proof = mt.get_merkle_proof(leaf)
+            assert proof == tuple(self.mt.get_merkle_proof(leaf))
+            assert mt.get_merkle_proof(leaf) is proof
+            assert mt.get_merkle_proof_at(i) == proof
+        assert mt.get_merkle_proof("unknown") == ()
+        stats = mt.proof_cache.stats()
+        assert stats["hits"] == len(self.odd_hashed_big_data)
+        assert stats["misses"] == 2 * len(self.odd_hashed_big_data) + 1
+
+    def test_proof_cache_is_invalidated_by_changes(self):
+        mt = MerkleTree(proof_cache=ProofCache())
+        mt.build_merkle_tree(self.odd_hashed_data)
+        generation = mt.get_generation()
+        leaf = self.odd_hashed_data[0]
+        proof = mt.get_merkle_proof(leaf)
+
+        mt.append_leaf(self.hash("new"))
+        assert mt.get_generation() > generation
+        appended = mt.get_merkle_proof(leaf)
+        assert appended != proof
+        assert mt.verify(appended, mt.get_root_tree(), leaf) is True
+
+        mt.update_leaf(1, self.hash("updated"))
+        updated = mt.get_merkle_proof_at(0)
+        assert updated != appended
+        assert mt.verify(updated, mt.get_root_tree(), leaf) is True
+
+        mt.build_merkle_tree(self.odd_hashed_data)
+        assert mt.get_merkle_proof(leaf) == proof
+
+    # ----------------------------------------------------------------
+    # Multi proof
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_get_multi_proof_and_verify(self, binary):
+        mt = MerkleTree(binary=binary)
+        mt.build_merkle_tree(self.odd_hashed_big_data)
+        indices = [98, 0, 1, 5, 40, 41, 77]
+        leaves, proof, flags = mt.get_multi_proof(indices)
+
+        assert leaves == [self.odd_hashed_big_data[i] for i in sorted(indices)]
+        assert len(proof) < sum(
+            len(mt.get_merkle_proof_at(i)) for i in indices
+        )
+        assert mt.verify_multi_proof(
+            proof, flags, self.BIG_DATA_ROOT_EXPECTED, leaves
+        ) is True
+
+    def test_get_multi_proof_by_leaves(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        leaves, proof, flags = self.mt.get_multi_proof(
+            [self.odd_hashed_data[4], self.odd_hashed_data[0]]
+        )
+        assert leaves == [self.odd_hashed_data[0], self.odd_hashed_data[4]]
+        assert proof == [
+            'f2ff61e5ca30a7708bfa760e5749e10dc81452d9006f8fb35db69d8f490ed637',
+            'd5863df95241788aade3430587471066c6f23a6ed59aff3ee7559928acb518b1',
+        ]
+        assert self.mt.verify_multi_proof(
+            proof, flags, self.ODD_ROOT_EXPECTED, leaves
+        ) is True
+
+    def test_verify_multi_proof_with_result_is_false(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        leaves, proof, flags = self.mt.get_multi_proof([1, 2])
+        root = self.ODD_ROOT_EXPECTED
+        assert self.mt.verify_multi_proof(
+            proof, flags, root, [leaves[0], "not present"]
+        ) is False
+        assert self.mt.verify_multi_proof(proof[:-1], flags, root, leaves) is False
+        assert self.mt.verify_multi_proof(proof, flags, root, leaves[:1]) is False
+
+    def test_get_multi_proof_but_raise_error(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        with pytest.raises(ValueError):
+            self.mt.get_multi_proof(["not present"])
+        with pytest.raises(IndexError):
+            self.mt.get_multi_proof([5])
+
     # ----------------------------------------------------------------
     # Verify merkle tree
     # ----------------------------------------------------------------
@@ -231,6 +599,89 @@ class TestMerkle:
             verified = self.mt.verify(proofs, self.mt.get_root_tree(), leaf)
             assert verified is True
 
+    # ----------------------------------------------------------------
+    # Verify batch
+    # ----------------------------------------------------------------
+    def test_verify_batch(self):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        items = [
+            (leaf, self.mt.get_merkle_proof(leaf))
+            for leaf in self.odd_hashed_big_data
+        ]
+        items.append(("not present", items[0][1]))
+        items.append((self.odd_hashed_big_data[0], items[1][1]))
+
+        expected = [True] * len(self.odd_hashed_big_data) + [False, False]
+        root = self.BIG_DATA_ROOT_EXPECTED
+        assert verify_batch(items, root) == expected
+        assert self.mt.verify_batch(iter(items), root) == expected
+        assert expected == [
+            self.mt.verify(proof, root, leaf) for leaf, proof in items
+        ]
+
+    def test_verify_batch_with_executor(self):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        items = [
+            (leaf, self.mt.get_merkle_proof(leaf))
+            for leaf in self.odd_hashed_big_data
+        ]
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            result = verify_batch(
+                items, self.BIG_DATA_ROOT_EXPECTED, executor, chunk_size=7
+            )
+        assert result == [True] * len(items)
+
+    def test_verify_batch_without_items(self):
+        assert verify_batch([], self.ODD_ROOT_EXPECTED) == []
+
+    @pytest.mark.parametrize("hash_backend", ["keccak", "sha256d"])
+    def test_verify_batch_matches_verify(self, hash_backend):
+        mt = MerkleTree(hash_backend=hash_backend)
+        mt.build_merkle_tree(self.odd_hashed_data)
+        root = mt.get_root_tree()
+        leaf = self.odd_hashed_data[0]
+        proof = mt.get_merkle_proof(leaf)
+        items = [
+            (leaf, proof),
+            (leaf.upper(), proof),
+            (leaf, [node.upper() for node in proof]),
+            (leaf, ["not hex"]),
+            (root, []),
+            (root.upper(), []),
+            ("not hex", []),
+            (leaf, mt.encode_proof(proof)),
+            (leaf, memoryview(mt.encode_proof(proof))),
+            (leaf.upper(), mt.encode_proof(proof)),
+            (self.odd_hashed_data[1], mt.encode_proof(proof)),
+            (root, mt.encode_proof([])),
+            (leaf, mt.encode_proof(proof)[:-1]),
+        ]
+        for root_tree in (root, root.upper(), "not hex"):
+            assert verify_batch(items, root_tree, hash_backend=hash_backend) == [
+                mt.verify(proof, root_tree, leaf) for leaf, proof in items
+            ]
+
+    def test_verify_batch_hashes_shared_pairs_once(self, monkeypatch):
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        items = [
+            (leaf, self.mt.get_merkle_proof_at(i))
+            for i, leaf in enumerate(self.odd_hashed_big_data)
+        ]
+        calls = []
+        digest = KeccakBackend.digest
+
+        def counting_digest(backend, data):
+            calls.append(data)
+            return digest(backend, data)
+
+        monkeypatch.setattr(KeccakBackend, "digest", counting_digest)
+        assert verify_batch(items, self.BIG_DATA_ROOT_EXPECTED) == [True] * 99
+        # The nodes of the tree, not the paths of every leaf. A promoted
+        # node puts a pair at two levels of the proofs.
+        assert len(set(calls)) == self.mt.get_size() - 99
+        assert len(calls) < 1.1 * len(set(calls))
+        assert len(calls) < sum(len(proof) for _, proof in items) / 5
+
     # ----------------------------------------------------------------
     # hash functions
     # ----------------------------------------------------------------
@@ -296,5 +747,436 @@ class TestMerkle:
     def test_get_root_tree_with_merkle_tree_not_created(self):
         with pytest.raises(IndexError):
             self.mt.get_root_tree()
-            
-    
\ No newline at end of file
+
+    # ----------------------------------------------------------------
+    # Binary storage
+    # ----------------------------------------------------------------
+    def test_binary_tree_matches_hex_tree(self):
+        binary = MerkleTree(binary=True)
+        binary.build_merkle_tree(self.odd_hashed_big_data)
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        assert binary.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+        assert binary.get_merkle_tree() == self.mt.get_merkle_tree()
+        assert binary.get_leaves() == self.odd_hashed_big_data
+        assert binary.count_leaves() == self.mt.count_leaves()
+        assert binary.get_depth() == self.mt.get_depth()
+        assert binary.get_size() == self.mt.get_size()
+
+    def test_binary_tree_returns_read_only_views(self):
+        binary = MerkleTree(binary=True)
+        binary.build_merkle_tree(self.odd_hashed_data)
+        leaves = binary.get_leaves()
+        assert not isinstance(leaves, list)
+        assert leaves == self.odd_hashed_data
+        assert binary.get_merkle_tree()[-1] == self.ODD_ROOT_EXPECTED
+        with pytest.raises(TypeError):
+            leaves[0] = self.hash("other")
+
+    def test_merkle_tree_has_slots(self):
+        assert not hasattr(self.mt, "__dict__")
+        with pytest.raises(AttributeError):
+            self.mt.other = 1
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_merkle_tree_pickles(self, binary):
+        mt = MerkleTree(binary=binary, hash_backend="keccak")
+        assert pickle.loads(pickle.dumps(mt)) == mt
+        mt.build_merkle_tree(self.odd_hashed_big_data)
+        for other in (pickle.loads(pickle.dumps(mt)), copy.deepcopy(mt)):
+            assert other == mt
+            assert other.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+            other.append_leaf(self.hash("new"))
+            assert other.get_root_tree() != mt.get_root_tree()
+            assert other.verify(
+                other.get_merkle_proof_at(99),
+                other.get_root_tree(),
+                self.hash("new"),
+            )
+
+    def test_binary_tree_stores_raw_digests(self):
+        binary = MerkleTree(binary=True)
+        binary.build_merkle_tree(self.odd_hashed_data)
+        assert [len(level) for level in binary._levels] == [
+            5 * 32, 2 * 32, 32, 32
+        ]
+        assert all(isinstance(level, bytearray) for level in binary._levels)
+        assert binary._proofs == {}
+
+    def test_binary_tree_get_merkle_proof(self):
+        binary = MerkleTree(binary=True)
+        binary.build_merkle_tree(self.odd_hashed_big_data)
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        root = binary.get_root_tree()
+        for leaf in self.odd_hashed_big_data:
+            proofs = binary.get_merkle_proof(leaf)
+            assert proofs == self.mt.get_merkle_proof(leaf)
+            assert binary.verify(proofs, root, leaf) is True
+
+    def test_binary_tree_get_merkle_proof_of_unknown_leaf(self):
+        binary = MerkleTree(binary=True)
+        binary.build_merkle_tree(self.odd_hashed_data)
+        assert binary.get_merkle_proof("not present") == []
+        assert binary.get_merkle_proof(self.hash("not present")) == []
+
+    def test_binary_tree_but_raise_value_error(self):
+        with pytest.raises(ValueError):
+            MerkleTree(binary=True).build_merkle_tree([])
+        with pytest.raises(ValueError):
+            MerkleTree(binary=True).build_merkle_tree(self.ODD_DATA)
+        with pytest.raises(ValueError):
+            MerkleTree(binary=True).build_merkle_tree(
+                [v.upper() for v in self.odd_hashed_data]
+            )
+
+    def test_binary_tree_get_root_tree_not_created(self):
+        with pytest.raises(IndexError):
+            MerkleTree(binary=True).get_root_tree()
+
+    # ----------------------------------------------------------------
+    # Distributed build
+    # ----------------------------------------------------------------
+    def test_combine_subtrees_built_by_processes(self):
+        data = self.odd_hashed_big_data
+        starts = range(0, len(data), 8)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            subtrees = list(executor.map(
+                build_shard, [data[i:i + 8] for i in starts], starts
+            ))
+        assert subtrees[-1] == Subtree(96, 3, subtrees[-1].root)
+
+        upper = MerkleTree.combine(reversed(subtrees))
+        assert upper.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+
+    @pytest.mark.parametrize("size", [1, 4, 16, 32])
+    def test_combine_proofs_compose(self, size):
+        data = self.odd_hashed_big_data
+        self.mt.build_merkle_tree(data)
+        shards = []
+        for start in range(0, len(data), size):
+            shard = MerkleTree()
+            shard.build_merkle_tree(data[start:start + size])
+            shards.append(shard)
+        upper = MerkleTree.combine(
+            shard.export_subtree(i * size) for i, shard in enumerate(shards)
+        )
+        assert upper.get_root_tree() == self.BIG_DATA_ROOT_EXPECTED
+        for i, leaf in enumerate(data):
+            proof = shards[i // size].get_merkle_proof_at(i % size) \
+                + upper.get_merkle_proof_at(i // size)
+            assert proof == self.mt.get_merkle_proof_at(i)
+            assert self.mt.verify(proof, self.BIG_DATA_ROOT_EXPECTED, leaf)
+
+    def test_combine_but_raise_value_error(self):
+        root = self.odd_hashed_data[0]
+        with pytest.raises(ValueError):
+            MerkleTree.combine([])
+        with pytest.raises(ValueError):
+            MerkleTree.combine([Subtree(0, 3, root), Subtree(3, 3, root)])
+        with pytest.raises(ValueError):
+            MerkleTree.combine([Subtree(0, 4, root), Subtree(8, 4, root)])
+        with pytest.raises(ValueError):
+            MerkleTree.combine([Subtree(0, 4, root), Subtree(4, 2, root),
+                                Subtree(8, 4, root)])
+        with pytest.raises(ValueError):
+            MerkleTree.combine([Subtree(0, 4, root),
+                                Subtree(4, 4, root, "sha3_256")])
+        with pytest.raises(IndexError):
+            MerkleTree().export_subtree(0)
+
+    # ----------------------------------------------------------------
+    # Leaf index
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_leaf_index(self, binary):
+        data = self.odd_hashed_big_data
+        mt = MerkleTree(binary=binary, leaf_index=True)
+        mt.build_merkle_tree(data + data[:2])
+        self.mt.build_merkle_tree(data)
+        assert mt.contains(data[3]) is True
+        assert mt.contains(self.hash("absent")) is False
+        assert mt.contains("not a digest") is False
+        assert mt.index_of(data[3]) == 3
+        assert mt.positions_of(data[1]) == [1, len(data) + 1]
+        assert mt.positions_of(self.hash("absent")) == []
+        with pytest.raises(ValueError):
+            mt.index_of(self.hash("absent"))
+        assert mt.get_merkle_proof(data[5]) == mt.get_merkle_proof_at(5)
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_leaf_index_is_maintained(self, binary):
+        data = self.odd_hashed_data
+        mt = MerkleTree(binary=binary, leaf_index=True)
+        mt.build_merkle_tree(data[:3])
+        mt.append_leaves(data[3:] + data[:1])
+        assert mt.positions_of(data[0]) == [0, len(data)]
+        assert mt.index_of(data[4]) == 4
+
+        mt.update_leaves({0: data[1], 4: self.hash("new")})
+        assert mt.positions_of(data[0]) == [len(data)]
+        assert mt.positions_of(data[1]) == [0, 1]
+        assert mt.contains(data[4]) is False
+        assert mt.index_of(self.hash("new")) == 4
+
+        mt.build_merkle_tree(data[2:])
+        assert mt.contains(data[0]) is False
+        assert mt.index_of(data[2]) == 0
+
+    def test_leaf_index_with_key_collisions(self):
+        # Binary leaves sharing the 8-byte prefix of the key
+        prefix = "00" * 8
+        data = [prefix + self.hash(str(i))[16:] for i in range(3)]
+        mt = MerkleTree(binary=True, leaf_index=True)
+        mt.build_merkle_tree(data)
+        assert list(mt._index_keys) == [0] * 3
+        assert [mt.index_of(leaf) for leaf in data] == [0, 1, 2]
+        assert mt.contains(prefix + "11" * 24) is False
+        mt.update_leaf(1, self.hash("other"))
+        assert [mt.positions_of(leaf) for leaf in data] == [[0], [], [2]]
+
+    def test_leaf_index_keeps_leaves_once(self):
+        mt = MerkleTree(leaf_index=True)
+        mt.build_merkle_tree(self.odd_hashed_data)
+        # The keys are the leaves of the tree, not copies
+        assert all(
+            key is leaf for key, leaf in zip(mt._index, mt.get_leaves())
+        )
+
+    def test_leaf_index_merges_changes(self):
+        data = self.odd_hashed_big_data
+        appended = [self.hash(str(i)) for i in range(1100)]
+        mt = MerkleTree(binary=True, leaf_index=True)
+        mt.build_merkle_tree(data)
+        mt.append_leaves(appended[:100])
+        assert len(mt._index) == 100
+        assert len(mt._index_keys) == len(data)
+
+        # Merged in the sorted arrays once the changes are too many
+        mt.append_leaves(appended[100:])
+        assert mt._index == {}
+        assert len(mt._index_keys) == len(data) + len(appended)
+        assert mt.index_of(appended[-1]) == len(data) + len(appended) - 1
+        assert mt.index_of(data[7]) == 7
+
+    def test_leaf_index_on_open(self, tmp_path):
+        path = str(tmp_path / "tree.mrkt")
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        self.mt.save(path)
+        mt = MerkleTree.open(path, leaf_index=True)
+        for i, leaf in enumerate(self.odd_hashed_big_data):
+            assert mt.index_of(leaf) == i
+            assert mt.get_merkle_proof(leaf) == self.mt.get_merkle_proof(leaf)
+
+    def test_contains_without_leaf_index(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        assert self.mt._index == {}
+        assert self.mt.contains(self.odd_hashed_data[2]) is True
+        assert self.mt.index_of(self.odd_hashed_data[2]) == 2
+        assert self.mt.positions_of(self.odd_hashed_data[2]) == [2]
+
+    # ----------------------------------------------------------------
+    # Diff
+    # ----------------------------------------------------------------
+    def test_get_nodes(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        tree = self.mt.get_merkle_tree()
+        assert self.mt.get_nodes(0, [4, 0]) == [tree[4], tree[0]]
+        assert self.mt.get_nodes(1, [0, 1]) == tree[5:7]
+        # The odd leaf is promoted
+        assert self.mt.get_nodes(2, [1]) == [tree[4]]
+        assert self.mt.get_nodes(3, [0]) == [self.ODD_ROOT_EXPECTED]
+        with pytest.raises(IndexError):
+            self.mt.get_nodes(1, [3])
+        with pytest.raises(IndexError):
+            self.mt.get_nodes(4, [0])
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_diff(self, binary):
+        changed = self.odd_hashed_big_data.copy()
+        for index in (0, 7, 8, 20):
+            changed[index] = self.hash(f"changed {index}")
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        other = MerkleTree(binary=binary)
+        other.build_merkle_tree(changed)
+        assert self.mt.diff(other) == [0, 7, 8, 20]
+        assert other.diff(self.mt) == [0, 7, 8, 20]
+        assert self.mt.diff(self.mt) == []
+
+    def test_diff_with_different_sizes(self):
+        data = self.odd_hashed_big_data
+        self.mt.build_merkle_tree(data)
+        other = MerkleTree()
+        other.build_merkle_tree(data[:13] + [self.hash("changed")] + data[14:17])
+        assert self.mt.diff(other) == [13] + list(range(17, len(data)))
+        assert other.diff(self.mt) == [13] + list(range(17, len(data)))
+        assert self.mt.diff(MerkleTree()) == list(range(len(data)))
+
+    def test_diff_remote_walks_differing_subtrees(self):
+        changed = self.odd_hashed_big_data.copy()
+        changed[5] = self.hash("changed")
+        self.mt.build_merkle_tree(self.odd_hashed_big_data)
+        other = MerkleTree()
+        other.build_merkle_tree(changed)
+
+        requests = []
+
+        def get_nodes(level, indexes):
+            requests.append((level, indexes))
+            return other.get_nodes(level, indexes)
+
+        assert self.mt.diff_remote(get_nodes, other.count_leaves()) == [5]
+        assert len(requests) == self.mt.get_depth()
+        assert all(len(indexes) <= 2 for _, indexes in requests)
+
+    def test_diff_but_raise_value_error(self):
+        self.mt.build_merkle_tree(self.odd_hashed_data)
+        other = MerkleTree(hash_backend="sha3_256")
+        other.build_merkle_tree(self.odd_hashed_data)
+        with pytest.raises(ValueError):
+            self.mt.diff(other)
+
+    # ----------------------------------------------------------------
+    # Sparse merkle tree
+    # ----------------------------------------------------------------
+    def test_sparse_merkle_tree_set_and_get(self):
+        smt = SparseMerkleTree()
+        empty_root = smt.get_root_tree()
+        key, value = self.odd_hashed_data[:2]
+        smt.set(key, value)
+        assert smt.get(key) == value
+        assert smt.get(value) is None
+        assert smt.count_leaves() == len(smt) == 1
+        assert smt.get_root_tree() != empty_root
+
+        smt.delete(key)
+        assert smt.get(key) is None
+        assert smt.get_root_tree() == empty_root
+        assert smt._nodes == {}
+
+    def test_sparse_merkle_tree_pickles(self):
+        smt = SparseMerkleTree()
+        key, value = self.odd_hashed_data[:2]
+        smt.set(key, value)
+        other = pickle.loads(pickle.dumps(smt))
+        assert other.get_root_tree() == smt.get_root_tree()
+        assert other.get(key) == value
+
+    def test_sparse_merkle_tree_root_does_not_depend_on_order(self):
+        first, second = SparseMerkleTree(), SparseMerkleTree()
+        for key, value in zip(self.odd_hashed_big_data, self.odd_hashed_data):
+            first.set(key, value)
+        pairs = list(zip(self.odd_hashed_big_data, self.odd_hashed_data))
+        for key, value in reversed(pairs):
+            second.set(key, value)
+        assert first.get_root_tree() == second.get_root_tree()
+
+    @pytest.mark.parametrize("hash_backend", ["keccak", "sha3_256"])
+    def test_sparse_merkle_tree_proofs(self, hash_backend):
+        smt = SparseMerkleTree(hash_backend=hash_backend)
+        values = dict(zip(self.odd_hashed_big_data, self.odd_hashed_big_data[1:]))
+        for key, value in values.items():
+            smt.set(key, value)
+        root = smt.get_root_tree()
+
+        for key, value in values.items():
+            proof = smt.get_proof(key)
+            assert smt.verify(proof, root, key, value) is True
+            assert smt.verify(proof, root, key, key) is False
+            assert smt.verify_non_inclusion(proof, root, key) is False
+
+        absent = self.hash("absent")
+        proof = smt.get_proof(absent)
+        assert smt.verify_non_inclusion(proof, root, absent) is True
+        assert smt.verify(proof, root, absent, absent) is False
+        # The proof of an empty key does not prove other keys empty
+        for key in values:
+            assert smt.verify_non_inclusion(proof, root, key) is False
+
+    def test_sparse_merkle_tree_proofs_are_compressed(self):
+        smt = SparseMerkleTree()
+        key, value = self.odd_hashed_data[:2]
+        assert smt.get_proof(key) == (0, [])
+        smt.set(key, value)
+        smt.set(value, key)
+        bitmap, siblings = smt.get_proof(key)
+        assert len(siblings) == 1
+        assert bitmap.bit_count() == 1
+        assert smt.verify((bitmap, siblings), smt.get_root_tree(), key, value)
+
+        # Malformed proofs
+        root = smt.get_root_tree()
+        assert smt.verify((bitmap, []), root, key, value) is False
+        assert smt.verify((1 << 256, siblings), root, key, value) is False
+        assert smt.verify((bitmap, ["xx"]), root, key, value) is False
+
+    def test_sparse_merkle_tree_but_raise_error(self):
+        smt = SparseMerkleTree()
+        with pytest.raises(ValueError):
+            smt.set("not a key", self.odd_hashed_data[0])
+        with pytest.raises(ValueError):
+            smt.set(self.odd_hashed_data[0], "not a value")
+        with pytest.raises(KeyError):
+            smt.delete(self.odd_hashed_data[0])
+        assert smt.verify((0, []), smt.get_root_tree(), "not a key", "") is False
+
+    # ----------------------------------------------------------------
+    # Encoded proofs
+    # ----------------------------------------------------------------
+    @pytest.mark.parametrize("hash_backend", ["keccak", "sha256d"])
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_encode_proof(self, hash_backend, binary):
+        mt = MerkleTree(binary=binary, hash_backend=hash_backend)
+        mt.build_merkle_tree(self.BIG_DATA)
+        root = mt.get_root_tree()
+        for index, leaf in enumerate(self.BIG_DATA):
+            proof = mt.get_merkle_proof_at(index)
+            encoded = mt.encode_proof(proof)
+            assert len(encoded) == 3 + 32 * len(proof)
+            assert mt.decode_proof(encoded) == list(proof)
+            assert mt.verify(encoded, root, leaf)
+            assert mt.verify(memoryview(encoded), root, leaf)
+            assert mt.verify(encoded, root, self.BIG_DATA[index - 1]) is False
+
+    def test_encode_proof_is_smaller(self):
+        mt = MerkleTree()
+        mt.build_merkle_tree(self.BIG_DATA)
+        proof = mt.get_merkle_proof(self.BIG_DATA[0])
+        # Against the JSON payload of the hex proof
+        assert 2 * len(mt.encode_proof(proof)) < len(json.dumps(proof))
+
+    def test_encode_proof_of_single_leaf(self):
+        mt = MerkleTree()
+        mt.build_merkle_tree(["Some data"])
+        encoded = mt.encode_proof(mt.get_merkle_proof("Some data"))
+        assert encoded == b"\x01\x01\x00"
+        assert mt.verify(encoded, mt.get_root_tree(), "Some data")
+
+    def test_encode_proof_with_long_depth(self):
+        mt = MerkleTree()
+        proof = self.BIG_DATA * 2
+        encoded = mt.encode_proof(proof)
+        # 198 siblings take a 2-byte varint
+        assert encoded[:4] == b"\x01\x01\xc6\x01"
+        assert mt.decode_proof(encoded) == proof
+
+    def test_encode_proof_but_raise_value_error(self):
+        self.mt.build_merkle_tree(self.ODD_DATA)
+        with pytest.raises(ValueError):
+            self.mt.encode_proof(self.mt.get_merkle_proof("Some data"))
+
+        mt = MerkleTree()
+        encoded = mt.encode_proof(self.BIG_DATA[:3])
+        for malformed in (
+            b"",
+            b"\x02" + encoded[1:],
+            encoded[:-1],
+            encoded + b"\x00",
+            encoded[:2] + b"\x80",
+        ):
+            with pytest.raises(ValueError):
+                mt.decode_proof(malformed)
+            assert mt.verify(malformed, self.BIG_DATA[0], "") is False
+
+        other = MerkleTree(hash_backend="sha256d")
+        with pytest.raises(ValueError):
+            other.decode_proof(encoded)
+        assert other.verify(encoded, self.BIG_DATA[0], self.BIG_DATA[1]) is False
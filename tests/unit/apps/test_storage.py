@@ -0,0 +1,184 @@
+"""
+Unit tests for apps/storage.py.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import copy
+import hashlib
+import mmap
+import pickle
+
+import pytest
+
+from src.apps.merkle import MerkleTree
+from src.apps.storage import (
+    HEADER_SIZE,
+    MAGIC,
+    LevelsView,
+    NodesView,
+    read_tree_file,
+)
+
+
+class TestStorage:
+    """Base Test for the merkle tree files"""
+
+    @pytest.fixture
+    def leaves(self) -> list[str]:
+        return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(37)]
+
+    @pytest.fixture
+    def tree(self, leaves) -> MerkleTree:
+        mt = MerkleTree()
+        mt.build_merkle_tree(leaves)
+        return mt
+
+    @pytest.fixture
+    def path(self, tmp_path, tree) -> str:
+        path = str(tmp_path / "tree.mrkt")
+        tree.save(path)
+        return path
+
+    def test_save_writes_header_and_nodes(self, path, tree):
+        with open(path, "rb") as file:
+            content = file.read()
+        assert content[:4] == MAGIC
+        assert len(content) == HEADER_SIZE + 32 * tree.get_size()
+        assert content[-32:].hex() == tree.get_root_tree()
+
+    @pytest.mark.parametrize("use_mmap", [True, False])
+    def test_open(self, path, tree, leaves, use_mmap):
+        opened = MerkleTree.open(path, mmap=use_mmap)
+        assert isinstance(opened._levels[0].obj, mmap.mmap) is use_mmap
+        assert opened.get_root_tree() == tree.get_root_tree()
+        assert opened.count_leaves() == tree.count_leaves()
+        assert opened.get_depth() == tree.get_depth()
+        assert opened.get_size() == tree.get_size()
+        assert opened.get_merkle_tree() == tree.get_merkle_tree()
+        for leaf in leaves:
+            assert opened.get_merkle_proof(leaf) == tree.get_merkle_proof(leaf)
+
+    def test_open_records_hash_backend(self, tmp_path, leaves):
+        mt = MerkleTree(binary=True, hash_backend="sha256d")
+        mt.build_merkle_tree(leaves)
+        path = str(tmp_path / "tree.mrkt")
+        mt.save(path)
+
+        opened = MerkleTree.open(path)
+        assert opened.hash_backend == "sha256d"
+        assert read_tree_file(path)[3] == "sha256d"
+        assert opened.get_root_tree() == mt.get_root_tree()
+
+    def test_changes_of_opened_tree_stay_in_memory(self, path, tree, leaves):
+        opened = MerkleTree.open(path)
+        opened.update_leaf(0, leaves[1])
+        opened.append_leaf(leaves[2])
+        assert opened.get_root_tree() != tree.get_root_tree()
+        assert MerkleTree.open(path).get_root_tree() == tree.get_root_tree()
+
+    def test_save_but_raise_error(self, tmp_path):
+        with pytest.raises(IndexError):
+            MerkleTree().save(str(tmp_path / "tree.mrkt"))
+
+        mt = MerkleTree()
+        mt.build_merkle_tree(["Some data", "that should"])
+        with pytest.raises(ValueError):
+            mt.save(str(tmp_path / "tree.mrkt"))
+
+    def test_open_but_raise_value_error(self, tmp_path, path):
+        other = tmp_path / "other.mrkt"
+        other.write_bytes(b"not a merkle tree")
+        with pytest.raises(ValueError):
+            MerkleTree.open(str(other))
+
+        with open(path, "rb") as file:
+            content = file.read()
+        other.write_bytes(content[:-32])
+        with pytest.raises(ValueError):
+            MerkleTree.open(str(other))
+
+        other.write_bytes(content[:4] + b"\x02" + content[5:])
+        with pytest.raises(ValueError):
+            MerkleTree.open(str(other))
+
+    def test_open_corrupted_header_but_raise_value_error(self, tmp_path, path):
+        with open(path, "rb") as file:
+            content = file.read()
+        other = tmp_path / "other.mrkt"
+
+        # A depth whose offsets do not fit the header
+        other.write_bytes(content[:30] + (2 ** 31).to_bytes(4, "little") + content[34:])
+        with pytest.raises(ValueError):
+            read_tree_file(str(other))
+
+        # The offset of the second level is not the one of the leaf count
+        other.write_bytes(content[:42] + (36).to_bytes(8, "little") + content[50:])
+        with pytest.raises(ValueError):
+            MerkleTree.open(str(other))
+
+    @pytest.mark.parametrize("use_mmap", [True, False])
+    def test_opened_tree_pickles(self, path, tree, use_mmap):
+        opened = MerkleTree.open(path, mmap=use_mmap)
+        for copied in (pickle.loads(pickle.dumps(opened)), copy.deepcopy(opened)):
+            assert all(isinstance(level, bytearray) for level in copied._levels)
+            assert copied.get_merkle_tree() == tree.get_merkle_tree()
+            copied.append_leaf(tree.get_root_tree())
+        # The opened tree still serves the file
+        assert isinstance(opened._levels[0], memoryview)
+        assert opened.get_root_tree() == tree.get_root_tree()
+
+    def test_nodes_view(self, leaves):
+        nodes = bytearray(b"".join(bytes.fromhex(leaf) for leaf in leaves))
+        view = NodesView(nodes, 2, 5)
+        assert len(view) == 3
+        assert view == leaves[2:5]
+        assert view[0] == leaves[2]
+        assert view[-1] == leaves[4]
+        assert view[1:] == leaves[3:5]
+        assert list(view) == leaves[2:5]
+        assert view.tobytes() == nodes[64:160]
+        assert NodesView(nodes) == leaves
+        assert view != leaves
+        with pytest.raises(IndexError):
+            view[3]
+
+    def test_nodes_view_of_levels(self, leaves):
+        nodes = [bytes.fromhex(leaf) for leaf in leaves]
+        levels = [bytearray(b"".join(nodes[:3])), b"", b"".join(nodes[3:])]
+        view = NodesView.of_levels(levels)
+        assert len(view) == len(leaves)
+        assert view == leaves
+        assert view[2] == leaves[2]
+        assert view[3] == leaves[3]
+        assert view[-1] == leaves[-1]
+        assert view[2:4] == leaves[2:4]
+        assert view.tobytes() == b"".join(nodes)
+        with pytest.raises(IndexError):
+            view[len(leaves)]
+        # Not a copy
+        levels[0][:32] = nodes[1]
+        assert view[0] == leaves[1]
+
+    def test_levels_view(self, leaves):
+        levels = [leaves[:3], [], leaves[3:]]
+        view = LevelsView(levels)
+        assert view == leaves
+        assert view == NodesView(b"".join(bytes.fromhex(leaf) for leaf in leaves))
+        assert view[3] == leaves[3]
+        assert view[-2:] == leaves[-2:]
+        # The nodes changed in place show, not the nodes appended
+        levels[0][0] = leaves[1]
+        levels[2].append(leaves[0])
+        assert view[0] == leaves[1]
+        assert len(view) == len(leaves)
+        assert list(view)[-1] == leaves[-1]
+
+    def test_nodes_view_is_read_only(self, leaves):
+        nodes = bytearray(b"".join(bytes.fromhex(leaf) for leaf in leaves))
+        view = NodesView(nodes)
+        with pytest.raises(TypeError):
+            view._segments[0][0] = 0
+        # Not a copy
+        nodes[:32] = bytes.fromhex(leaves[1])
+        assert view[0] == leaves[1]
@@ -0,0 +1,83 @@
+"""
+Unit tests for the benchmarks package.
+
+Author:
+    Arnaud SENE, arnaud.sene@pm.me
+"""
+import json
+
+import pytest
+
+from src.benchmarks.cli import main
+from src.benchmarks.compare import Regression, compare
+from src.benchmarks.generators import make_leaves, sample_indexes
+from src.benchmarks.suite import run, run_case
+
+
+def report(**metrics) -> dict:
+    return {"results": [{"leaves": 1000, "mode": "hex", **metrics}]}
+
+
+class TestBenchmarks:
+    """Base Test for the benchmark suite"""
+
+    def test_generators_are_deterministic(self):
+        leaves = make_leaves(10)
+        assert leaves == make_leaves(10)
+        assert leaves != make_leaves(10, seed=1)
+        assert len(set(leaves)) == 10
+        assert all(len(bytes.fromhex(leaf)) == 32 for leaf in leaves)
+        assert sample_indexes(10, 5) == sample_indexes(10, 5)
+
+    @pytest.mark.parametrize("mode", ["hex", "binary"])
+    def test_run_case(self, mode):
+        result = run_case(64, mode, lookups=16)
+        assert result["leaves"] == 64
+        assert result["mode"] == mode
+        assert result["build_hashes_per_leaf"] == 63 / 64
+        for metric in (
+            "build_leaves_per_s",
+            "build_hashes_per_s",
+            "proofs_per_s",
+            "peak_rss_mb",
+        ):
+            assert result[metric] > 0
+
+    def test_run_case_but_raise_value_error(self):
+        with pytest.raises(ValueError):
+            run_case(64, "other")
+
+    def test_run(self):
+        results = run([16, 32], ["hex"], lookups=4, isolate=False)
+        assert [r["leaves"] for r in results["results"]] == [16, 32]
+        assert results["meta"]["lookups"] == 4
+
+    def test_compare(self):
+        baseline = report(build_leaves_per_s=100.0, peak_rss_mb=10.0)
+        assert compare(baseline, baseline) == []
+        assert compare(baseline, report(build_leaves_per_s=95.0)) == []
+
+        regressions = compare(
+            baseline, report(build_leaves_per_s=80.0, peak_rss_mb=12.0)
+        )
+        assert regressions == [
+            Regression(1000, "hex", "build_leaves_per_s", 100.0, 80.0),
+            Regression(1000, "hex", "peak_rss_mb", 10.0, 12.0),
+        ]
+        assert regressions[0].change == pytest.approx(-0.2)
+        assert "-20.0%" in str(regressions[0])
+
+    def test_cli(self, tmp_path, capsys):
+        output = tmp_path / "results.json"
+        argv = ["run", "--leaves", "16", "--modes", "hex", "--lookups", "4"]
+        assert main(argv + ["--no-isolate", "-o", str(output)]) == 0
+        results = json.loads(output.read_text())
+        assert results["results"][0]["leaves"] == 16
+
+        slower = json.loads(output.read_text())
+        slower["results"][0]["build_leaves_per_s"] /= 2
+        other = tmp_path / "slower.json"
+        other.write_text(json.dumps(slower))
+        assert main(["compare", str(output), str(output)]) == 0
+        assert main(["compare", str(output), str(other)]) == 1
+        assert "build_leaves_per_s" in capsys.readouterr().err